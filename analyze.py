@@ -0,0 +1,234 @@
+"""Headless fruit detection, quality and nutrition analysis over folders, globs and videos
+
+Runs the same detection + FruitAnalyzer + nutrition lookup as the GUI without importing Qt, spreading the
+inputs over a pool of worker processes and writing every detection to one consolidated CSV or JSON file.
+
+Usage:
+    $ python analyze.py --source path/to/images --weights weights/Fruits.pt --workers 4
+    $ python analyze.py --source 'crates/**/*.jpg' video.mp4 --output results.json
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import cv2
+import torch
+
+from fruit_detector import DetectorConfig, FruitDetector
+from utils.datasets import img_formats, vid_formats
+from utils.general import check_requirements, increment_path, set_logging
+
+fields = ['source', 'frame', 'track_id', 'fruit', 'confidence', 'x1', 'y1', 'x2', 'y2', 'quality_score', 'ripeness_level',
+          'estimated_weight', 'defects', 'recommendations', 'calories', 'protein', 'carbs', 'fiber', 'kcal']
+
+detector = None  # per-process FruitDetector, created by init_worker()
+
+
+def collect_sources(sources):
+    # Expand directories, globs and files into sorted lists of image and video paths
+    files = []
+    for s in sources:
+        p = str(Path(s).absolute())
+        if '*' in p:
+            files += sorted(glob.glob(p, recursive=True))
+        elif os.path.isdir(p):
+            files += sorted(glob.glob(os.path.join(p, '*.*')))
+        elif os.path.isfile(p):
+            files.append(p)
+        else:
+            raise Exception(f'ERROR: {p} does not exist')
+    images = [x for x in files if x.split('.')[-1].lower() in img_formats]
+    videos = [x for x in files if x.split('.')[-1].lower() in vid_formats]
+    return images, videos
+
+
+def init_worker(opt, threads):
+    # Load one model per worker process and split the CPU threads between workers
+    global detector
+    torch.set_num_threads(threads)
+    config = DetectorConfig.from_args(opt)
+    config.intra_op_threads = config.intra_op_threads or threads
+    detector = FruitDetector(config)
+
+
+def to_rows(source, frame, result):
+    rows = []
+    for a in result['analysis']:
+        q, nutr = a['quality'], a['nutritional_info'] or {}
+        rows.append({
+            'source': source,
+            'frame': frame,
+            'track_id': a.get('track_id') or '',
+            'fruit': a['name'],
+            'confidence': round(a['confidence'], 4),
+            'x1': a['bbox'][0], 'y1': a['bbox'][1], 'x2': a['bbox'][2], 'y2': a['bbox'][3],
+            'quality_score': round(float(q.quality_score), 4),
+            'ripeness_level': round(float(q.ripeness_level), 4),
+            'estimated_weight': round(float(q.estimated_weight), 2),
+            'defects': ', '.join(q.defects),
+            'recommendations': ', '.join(q.recommendations),
+            'calories': nutr.get('calories', ''),
+            'protein': nutr.get('protein', ''),
+            'carbs': nutr.get('carbs', ''),
+            'fiber': nutr.get('fiber', ''),
+            'kcal': round(a['kcal'], 1) if nutr else ''})
+    return rows
+
+
+def process_images(task):
+    # Analyze a chunk of image files with one forward pass, returns (files done, rows)
+    paths, save_dir = task
+    frames, names = [], []
+    for p in paths:
+        im = cv2.imread(p)  # BGR
+        if im is None:
+            print(f'WARNING: could not read {p}, skipping')
+            continue
+        frames.append(im)
+        names.append(p)
+    rows = []
+    for p, (image, result) in zip(names, detector.process(frames, draw=save_dir is not None)):
+        rows += to_rows(p, 0, result)
+        if save_dir is not None:
+            cv2.imwrite(str(Path(save_dir) / Path(p).name), image)
+    return len(paths), rows
+
+
+def process_video(task):
+    # Analyze every frame of a video in batches, returns (1, rows)
+    path, save_dir = task
+    cap = cv2.VideoCapture(path)
+    writer, rows, batch, i = None, [], [], 0
+    tracker = detector.new_tracker()  # one track ID per fruit for the whole video
+    gate = detector.new_motion_gate()
+    while True:
+        valid, frame = cap.read()
+        if valid:
+            batch.append(frame)
+        if batch and (not valid or len(batch) >= detector.batch_size):
+            for image, result in detector.process(batch, draw=save_dir is not None, tracker=tracker, gate=gate):
+                rows += to_rows(path, i, result)
+                if save_dir is not None:
+                    if writer is None:
+                        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+                        writer = cv2.VideoWriter(str(Path(save_dir) / Path(path).name), cv2.VideoWriter_fourcc(*'mp4v'),
+                                                 fps, (image.shape[1], image.shape[0]))
+                    writer.write(image)
+                i += 1
+            batch = []
+        if not valid:
+            break
+    cap.release()
+    if writer is not None:
+        writer.release()
+    return 1, rows
+
+
+def analyze(opt):
+    set_logging()
+    images, videos = collect_sources(opt.source)
+    assert images or videos, f'No images or videos found in {opt.source}'
+    save_dir = increment_path(Path(opt.project) / opt.name, exist_ok=opt.exist_ok)  # increment run
+    save_dir.mkdir(parents=True, exist_ok=True)
+    img_dir = save_dir / 'images' if opt.save_img else None
+    if img_dir:
+        img_dir.mkdir(exist_ok=True)
+    output = Path(opt.output) if opt.output else save_dir / 'results.csv'
+
+    n = opt.batch_size
+    tasks = [(process_images, (images[i:i + n], img_dir)) for i in range(0, len(images), n)]
+    tasks += [(process_video, (v, img_dir)) for v in videos]
+    workers = min(opt.workers, len(tasks))
+    threads = max((os.cpu_count() or 1) // max(workers, 1), 1)
+    print(f'{len(images)} images, {len(videos)} videos, {workers} workers x {threads} threads')
+
+    t0, nf, nd = time.time(), 0, 0
+    with open(output, 'w', newline='') as f:
+        if output.suffix == '.json':
+            f.write('[\n')
+            write = lambda row: f.write(('' if nd == 0 else ',\n') + json.dumps(row))
+        else:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            write = writer.writerow
+
+        if workers > 0:
+            pool = Pool(workers, initializer=init_worker, initargs=(opt, threads))
+            results = pool.imap(run_task, tasks)
+        else:  # single process
+            init_worker(opt, os.cpu_count() or 1)
+            pool, results = None, map(run_task, tasks)
+
+        for done, rows in results:
+            for row in rows:
+                write(row)
+                nd += 1
+            nf += done
+            print(f'{nf}/{len(images) + len(videos)} files, {nd} detections ({time.time() - t0:.1f}s)')
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if output.suffix == '.json':
+            f.write('\n]\n')
+
+    print(f'Results saved to {output}' + (f', annotated files to {img_dir}' if img_dir else ''))
+    print(f'Done. ({time.time() - t0:.3f}s)')
+
+
+@torch.no_grad()
+def run_task(task):
+    fn, args = task
+    return fn(args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', nargs='+', type=str, default=['images'], help='files, folders or globs')
+    parser.add_argument('--weights', nargs='+', type=str, default='weights/Fruits.pt', help='model.pt path(s)')
+    parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='object confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='IOU threshold for NMS')
+    parser.add_argument('--device', default='cpu', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--backend', default='auto', choices=('auto', 'torch', 'onnx'),
+                        help='inference backend, auto uses ONNX Runtime on CPU if a .onnx model is available')
+    parser.add_argument('--intra-op-threads', type=int, default=0, help='ONNX Runtime intra-op threads, 0 for default')
+    parser.add_argument('--inter-op-threads', type=int, default=0, help='ONNX Runtime inter-op threads, 0 for default')
+    parser.add_argument('--int8', action='store_true', help='use the INT8 model made by models/quantize.py')
+    parser.add_argument('--channels-last', action='store_true', help='channels_last memory format (PyTorch backend)')
+    parser.add_argument('--classes', nargs='+', type=int, help='filter by class: --class 0, or --class 0 2 3')
+    parser.add_argument('--agnostic-nms', action='store_true', help='class-agnostic NMS')
+    parser.add_argument('--batch-size', type=int, default=8, help='images or video frames per forward pass')
+    parser.add_argument('--no-track', dest='track', action='store_false', help='analyze every video frame independently')
+    parser.add_argument('--track-max-age', type=int, default=30, help='frames a lost fruit is remembered for')
+    parser.add_argument('--reanalyze-iou', type=float, default=0.8, help='re-analyze a tracked fruit below this box IoU')
+    parser.add_argument('--motion-gate', action='store_true', help='skip inference on video frames without motion')
+    parser.add_argument('--motion-threshold', type=float, default=0.002, help='fraction of changed pixels for motion')
+    parser.add_argument('--motion-refresh', type=int, default=30, help='run inference at least every n frames')
+    parser.add_argument('--tile', type=int, default=0, help='tiled inference tile size (pixels), 0 to disable')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='overlap between tiles (fraction)')
+    parser.add_argument('--tile-batch', type=int, default=8, help='tiles per forward pass')
+    parser.add_argument('--cache-size', type=int, default=128, help='images kept in the result cache, 0 to disable')
+    parser.add_argument('--cache-dir', type=str, default='', help='optional on-disk result cache directory')
+    parser.add_argument('--cache-disk-mb', type=float, default=512, help='on-disk result cache size limit (MB)')
+    parser.add_argument('--roi-max-pixels', type=int, default=0, help='downsample larger fruit ROIs for color analysis, 0 off')
+    parser.add_argument('--analysis-workers', type=int, default=0, help='fruit analysis threads/processes, 0 inline')
+    parser.add_argument('--analysis-pool', default='thread', choices=('thread', 'process'),
+                        help='fruit analysis on threads, or on processes with frames in shared memory (--workers 0)')
+    parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4), help='worker processes, 0 to run inline')
+    parser.add_argument('--output', type=str, default='', help='results file (.csv or .json), default project/name/results.csv')
+    parser.add_argument('--save-img', action='store_true', help='save annotated images/videos')
+    parser.add_argument('--project', default='runs/analyze', help='save results to project/name')
+    parser.add_argument('--name', default='exp', help='save results to project/name')
+    parser.add_argument('--exist-ok', action='store_true', help='existing project/name ok, do not increment')
+    opt = parser.parse_args()
+    print(opt)
+    check_requirements(exclude=('tensorboard', 'pycocotools', 'thop', 'PySide6'))
+
+    analyze(opt)
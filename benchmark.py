@@ -0,0 +1,184 @@
+"""Micro-benchmarks for the fruit detector hot paths
+
+Usage:
+    $ python benchmark.py --task prepare --weights weights/Fruits.pt --source images/fruits.jpg
+    $ python benchmark.py --task hsv --source images
+    $ python benchmark.py --task roi --data data/fruits.yaml --roi-max-pixels 4096 16384 65536
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+import yaml
+
+from models.experimental import attempt_load
+from utils.datasets import img2label_paths, img_formats, letterbox
+from utils.fruit_analysis import ColorIntegralIndex, FruitAnalyzer, HSVRangeLUT, numba
+from utils.general import check_img_size, set_logging, xywhn2xyxy
+from utils.torch_utils import InputBuffer, prepare_model, select_device, smart_inference_mode, time_synchronized
+
+
+def timeit(fn, n=50, warmup=5):
+    # Returns the per-call times of fn() in ms
+    for _ in range(warmup):
+        fn()
+    t = []
+    for _ in range(n):
+        t0 = time_synchronized()
+        fn()
+        t.append((time_synchronized() - t0) * 1000)
+    return np.array(t)
+
+
+def print_results(results, unit='ms/frame'):
+    base = None
+    print(f"\n{'Variant':>28s}{'mean':>12s}{'median':>12s}{'min':>12s}{'saving':>12s}   ({unit})")
+    for name, t in results.items():
+        base = base or t.mean()
+        print(f'{name:>28s}{t.mean():12.2f}{np.median(t):12.2f}{t.min():12.2f}{100 * (1 - t.mean() / base):11.1f}%')
+
+
+def bench_prepare(opt):
+    # Per-frame forward pass cost of a model straight out of attempt_load() vs the prepared inference model
+    device = select_device(opt.device)
+    model = attempt_load(opt.weights, map_location=device)  # fused, autograd state kept
+    stride = int(model.stride.max())
+    imgsz = check_img_size(opt.img_size, s=stride)
+    im0 = cv2.imread(opt.source)
+    assert im0 is not None, f'Image Not Found {opt.source}'
+    img = letterbox(im0, imgsz, stride=stride)[0][:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
+    img = np.ascontiguousarray(np.stack([img] * opt.batch_size, 0))
+
+    def baseline():
+        x = torch.from_numpy(img).to(device).float() / 255.0  # new input tensor every frame
+        return model(x, augment=False)[0]
+
+    @torch.no_grad()
+    def no_grad():
+        x = torch.from_numpy(img).to(device).float() / 255.0
+        return model(x, augment=False)[0]
+
+    prepared = prepare_model(attempt_load(opt.weights, map_location=device), opt.channels_last)
+    inputs = InputBuffer(opt.channels_last)
+
+    @smart_inference_mode()
+    def inference():
+        return prepared(inputs(img, device), augment=False)[0]
+
+    results = {'attempt_load': timeit(baseline, opt.n),
+               'attempt_load + no_grad': timeit(no_grad, opt.n),
+               'prepared + inference_mode': timeit(inference, opt.n)}
+    print(f'\n{img.shape[0]}x{img.shape[2]}x{img.shape[3]} input on {device}, {opt.n} runs')
+    print_results(results)
+
+
+def bench_hsv(opt):
+    # Color range counting of the fruit analyzer from a BGR ROI: one cv2.inRange() per range vs the compiled HSV
+    # lookup table vs the fused numba kernel (when numba is installed)
+    p = Path(opt.source)
+    files = sorted(x for x in p.glob('*') if x.suffix[1:].lower() in img_formats) if p.is_dir() else [p]
+    analyzer = FruitAnalyzer()
+    ranges = analyzer.lut.ranges
+    lut = HSVRangeLUT(ranges, jit=False)  # OpenCV + NumPy
+    fused = HSVRangeLUT(ranges) if numba is not None else None
+
+    def inrange_counts(im, ranges=ranges):
+        hsv = cv2.cvtColor(im, cv2.COLOR_BGR2HSV)
+        return np.array([np.sum(cv2.inRange(hsv, np.array(lower), np.array(upper)) > 0) for lower, upper in ranges])
+
+    one_fruit = analyzer.fruit_ranges['apple'] + analyzer.defect_ranges  # what analyze_fruit() needs per ROI
+    roi = {'ROI: inRange, all ranges': lambda im: inrange_counts(im),
+           'ROI: inRange, one fruit': lambda im: inrange_counts(im, one_fruit),
+           'ROI: LUT + histogram': lut.histogram_bgr}
+    if fused is not None:
+        roi['ROI: numba fused kernel'] = fused.histogram_bgr
+        fused.histogram_bgr(np.zeros((1, 1, 3), np.uint8))  # compile outside of the timings
+
+    results = {}
+    for f in files:
+        im0 = cv2.imread(str(f))
+        assert im0 is not None, f'Image Not Found {f}'
+        counts = inrange_counts(im0)
+        assert (counts == lut.histogram_bgr(im0).range_counts).all(), f'LUT mismatch on {f}'
+        assert fused is None or (counts == fused.histogram_bgr(im0).range_counts).all(), f'kernel mismatch on {f}'
+        region = (0, 0, im0.shape[1], im0.shape[0])
+        a, b = ColorIntegralIndex(im0, ranges, region), ColorIntegralIndex(im0, ranges, region, lut)
+        assert (a.tables == b.tables).all(), f'LUT index mismatch on {f}'
+
+        for name, fn in [(k, lambda fn=fn: fn(im0)) for k, fn in roi.items()] + [
+                ('frame index: inRange', lambda: ColorIntegralIndex(im0, ranges, region)),
+                ('frame index: LUT', lambda: ColorIntegralIndex(im0, ranges, region, lut))]:
+            results.setdefault(name, []).append(timeit(fn, opt.n) / (im0.shape[0] * im0.shape[1] / 1E6))
+    print(f'\n{len(files)} images, {len(ranges)} color ranges, {opt.n} runs, results match' +
+          ('' if fused is not None else ' (numba not installed, fused kernel skipped)'))
+    print_results({k: np.concatenate(v) for k, v in results.items() if k.startswith('ROI')}, unit='ms/megapixel')
+    print_results({k: np.concatenate(v) for k, v in results.items() if k.startswith('frame')}, unit='ms/megapixel')
+
+
+def bench_roi(opt):
+    # Validation of resolution capped ROI analysis: ripeness, quality and defects of every labeled fruit of the
+    # dataset's val images at full resolution vs with ROIs downsampled to --roi-max-pixels
+    with open(opt.data) as f:
+        data = yaml.safe_load(f)
+    p = Path(data['val'])
+    files = sorted(x for x in p.glob('*') if x.suffix[1:].lower() in img_formats) if p.is_dir() else [p]
+    fruits = []  # (image, bbox, fruit type) of every label
+    for f, lb in zip(files, img2label_paths([str(x) for x in files])):
+        if not Path(lb).exists():
+            continue
+        im = cv2.imread(str(f))
+        labels = np.loadtxt(lb, ndmin=2)
+        if im is None or not len(labels):
+            continue
+        boxes = xywhn2xyxy(labels[:, 1:5], w=im.shape[1], h=im.shape[0]).round().astype(int)
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, im.shape[1])
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, im.shape[0])
+        fruits += [(im, tuple(b), data['names'][int(c)]) for c, b in zip(labels[:, 0], boxes.tolist())]
+    assert fruits, f'No labeled fruits found in {p}'
+
+    def run(analyzer):
+        out, t = [], []
+        for im, box, name in fruits:
+            t0 = time.perf_counter()
+            out.append(analyzer.analyze_fruit(im, box, name))
+            t.append((time.perf_counter() - t0) * 1000)
+        return out, np.array(t)
+
+    full, t_full = run(FruitAnalyzer())
+    area = np.array([(b[2] - b[0]) * (b[3] - b[1]) for _, b, _ in fruits])
+    print(f'\n{len(fruits)} labeled fruits in {len(files)} images, ROI median {np.median(area):.0f} / max {area.max()} pixels')
+    print(f"{'max pixels':>12s}{'capped':>9s}{'ripeness MAE':>14s}{'max error':>11s}{'quality MAE':>13s}"
+          f"{'defects match':>15s}{'mean ms':>10s}{'max ms':>9s}")
+    print(f"{'full':>12s}{0:9d}{0:14.4f}{0:11.4f}{0:13.4f}{100:14.1f}%{t_full.mean():10.3f}{t_full.max():9.3f}")
+    for cap in opt.roi_max_pixels:
+        capped, t = run(FruitAnalyzer(cap))
+        r = np.abs([a.ripeness_level - b.ripeness_level for a, b in zip(full, capped)])
+        q = np.abs([a.quality_score - b.quality_score for a, b in zip(full, capped)])
+        d = np.mean([a.defects == b.defects for a, b in zip(full, capped)])
+        print(f'{cap:12d}{(area > cap).sum():9d}{r.mean():14.4f}{r.max():11.4f}{q.mean():13.4f}{100 * d:14.1f}%'
+              f'{t.mean():10.3f}{t.max():9.3f}')
+
+
+tasks = {'prepare': bench_prepare, 'hsv': bench_hsv, 'roi': bench_roi}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--task', default='prepare', choices=list(tasks), help='benchmark to run')
+    parser.add_argument('--weights', nargs='+', type=str, default='weights/Fruits.pt', help='model.pt path(s)')
+    parser.add_argument('--source', type=str, default='images/fruits.jpg', help='image file (or directory for hsv)')
+    parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
+    parser.add_argument('--batch-size', type=int, default=1, help='frames per forward pass')
+    parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--channels-last', action='store_true', help='channels_last memory format')
+    parser.add_argument('--data', type=str, default='data/fruits.yaml', help='labeled dataset.yaml path (roi)')
+    parser.add_argument('--roi-max-pixels', nargs='+', type=int, default=[4096, 16384, 65536], help='ROI caps (roi)')
+    parser.add_argument('--n', type=int, default=50, help='timed runs')
+    opt = parser.parse_args()
+    print(opt)
+    set_logging()
+
+    tasks[opt.task](opt)
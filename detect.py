@@ -3,17 +3,21 @@ import time
 from pathlib import Path
 
 import cv2
+import numpy as np
 import torch
 import torch.backends.cudnn as cudnn
 
 from models.experimental import attempt_load
-from utils.datasets import LoadStreams, LoadImages
+from utils.datasets import LoadStreams, LoadImages, letterbox
 from utils.general import check_img_size, check_requirements, check_imshow, non_max_suppression, apply_classifier, \
     scale_coords, xyxy2xywh, strip_optimizer, set_logging, increment_path, save_one_box
 from utils.plots import colors, plot_one_box
-from utils.torch_utils import select_device, load_classifier, time_synchronized
+from utils.tiling import tiled_predict
+from utils.torch_utils import select_device, load_classifier, time_synchronized, prepare_model, InputBuffer, \
+    smart_inference_mode
 
 
+@smart_inference_mode()
 def detect(opt):
     source, weights, view_img, save_txt, imgsz = opt.source, opt.weights, opt.view_img, opt.save_txt, opt.img_size
     save_img = not opt.nosave and not source.endswith('.txt')  # save inference images
@@ -30,12 +34,24 @@ def detect(opt):
     half = device.type != 'cpu'  # half precision only supported on CUDA
 
     # Load model
-    model = attempt_load(weights, map_location=device)  # load FP32 model
+    model = prepare_model(attempt_load(weights, map_location=device), opt.channels_last)  # load FP32 model
     stride = int(model.stride.max())  # model stride
     imgsz = check_img_size(imgsz, s=stride)  # check img_size
     names = model.module.names if hasattr(model, 'module') else model.names  # get class names
     if half:
         model.half()  # to FP16
+    inputs = InputBuffer(opt.channels_last)  # input tensor reused across frames
+    tile_inputs = InputBuffer(opt.channels_last)
+
+    def predict_tiles(crops):
+        # Forward pass + NMS over a list of BGR tiles, boxes in tile coordinates
+        x = np.stack([letterbox(c, imgsz, auto=False)[0] for c in crops], 0)[:, :, :, ::-1].transpose(0, 3, 1, 2)
+        x = tile_inputs(np.ascontiguousarray(x), device, torch.float16 if half else torch.float32)
+        pred = model(x, augment=opt.augment)[0]
+        pred = non_max_suppression(pred, opt.conf_thres, opt.iou_thres, classes=opt.classes, agnostic=opt.agnostic_nms)
+        for det, c in zip(pred, crops):
+            det[:, :4] = scale_coords(x.shape[2:], det[:, :4], c.shape).round()
+        return pred
 
     # Second-stage classifier
     classify = False
@@ -57,18 +73,19 @@ def detect(opt):
         model(torch.zeros(1, 3, imgsz, imgsz).to(device).type_as(next(model.parameters())))  # run once
     t0 = time.time()
     for path, img, im0s, vid_cap in dataset:
-        img = torch.from_numpy(img).to(device)
-        img = img.half() if half else img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-        if img.ndimension() == 3:
-            img = img.unsqueeze(0)
+        img = inputs(img if img.ndim == 4 else img[None], device, torch.float16 if half else torch.float32)
 
         # Inference
         t1 = time_synchronized()
-        pred = model(img, augment=opt.augment)[0]
+        if opt.tile:  # overlapping tiles of the original image, boxes already in im0 coordinates
+            pred = [tiled_predict(predict_tiles, im0, opt.tile, opt.tile_overlap, opt.tile_batch,
+                                  agnostic=opt.agnostic_nms) for im0 in (im0s if webcam else [im0s])]
+        else:
+            pred = model(img, augment=opt.augment)[0]
 
-        # Apply NMS
-        pred = non_max_suppression(pred, opt.conf_thres, opt.iou_thres, classes=opt.classes, agnostic=opt.agnostic_nms)
+            # Apply NMS
+            pred = non_max_suppression(pred, opt.conf_thres, opt.iou_thres, classes=opt.classes,
+                                       agnostic=opt.agnostic_nms)
         t2 = time_synchronized()
 
         # Apply Classifier
@@ -90,7 +107,8 @@ def detect(opt):
             imc = im0.copy() if opt.save_crop else im0  # for opt.save_crop
             if len(det):
                 # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
+                if not opt.tile:
+                    det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
 
                 # Print results
                 for c in det[:, -1].unique():
@@ -169,14 +187,17 @@ if __name__ == '__main__':
     parser.add_argument('--line-thickness', default=3, type=int, help='bounding box thickness (pixels)')
     parser.add_argument('--hide-labels', default=False, action='store_true', help='hide labels')
     parser.add_argument('--hide-conf', default=False, action='store_true', help='hide confidences')
+    parser.add_argument('--channels-last', action='store_true', help='channels_last memory format')
+    parser.add_argument('--tile', type=int, default=0, help='tiled inference tile size (pixels), 0 to disable')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='overlap between tiles (fraction)')
+    parser.add_argument('--tile-batch', type=int, default=8, help='tiles per forward pass')
     opt = parser.parse_args()
     print(opt)
     check_requirements(exclude=('tensorboard', 'pycocotools', 'thop'))
 
-    with torch.no_grad():
-        if opt.update:  # update all models (to fix SourceChangeWarning)
-            for opt.weights in ['yolov5s.pt', 'yolov5m.pt', 'yolov5l.pt', 'yolov5x.pt']:
-                detect(opt=opt)
-                strip_optimizer(opt.weights)
-        else:
+    if opt.update:  # update all models (to fix SourceChangeWarning)
+        for opt.weights in ['yolov5s.pt', 'yolov5m.pt', 'yolov5l.pt', 'yolov5x.pt']:
             detect(opt=opt)
+            strip_optimizer(opt.weights)
+    else:
+        detect(opt=opt)
@@ -1,39 +1,15 @@
-import argparse
+import os
 import time
+from datetime import datetime
 from pathlib import Path
-import os
 
-import numpy as np
-import cv2
-import torch
-from PySide6.QtCore import QObject, Signal, QThread
+from PySide6.QtCore import QObject, Signal
 from PySide6.QtGui import QImage
 
-from models.experimental import attempt_load
-from utils.datasets import letterbox
-from utils.general import check_img_size, check_requirements, non_max_suppression, scale_coords
-from utils.plots import colors, plot_one_box
-from utils.torch_utils import select_device
-from utils.nutritional_info import get_nutritional_info
-from utils.fruit_analysis import FruitAnalyzer
-from utils.report_generator import ReportGenerator
-from utils.data_exporter import DataExporter
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--weights', nargs='+', type=str, default='weights/Fruits.pt', help='model.pt path(s)')
-parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
-parser.add_argument('--conf-thres', type=float, default=0.25, help='object confidence threshold')
-parser.add_argument('--iou-thres', type=float, default=0.45, help='IOU threshold for NMS')
-parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
-parser.add_argument('--save-conf', action='store_true', help='save confidences in --save-txt labels')
-parser.add_argument('--classes', nargs='+', type=int, help='filter by class: --class 0, or --class 0 2 3')
-parser.add_argument('--agnostic-nms', action='store_true', help='class-agnostic NMS')
-parser.add_argument('--project', default='runs/detect', help='save results to project/name')
-parser.add_argument('--name', default='exp', help='save results to project/name')
-parser.add_argument('--hide-conf', default=False, action='store_true', help='hide confidences')
-args = parser.parse_args()
-
-check_requirements(exclude=('tensorboard', 'pycocotools', 'thop'))
+from fruit_detector import DetectorConfig, FruitDetector
+from utils.report_generator import ReportWorker
+from utils.data_exporter import DataExporter, SessionWriter
+
 
 class Detector(QObject):
     signal_frame = Signal(QImage)
@@ -42,171 +18,143 @@ class Detector(QObject):
     signal_show_nutrition = Signal(dict)
     signal_export_complete = Signal(str, str)  # filename, type
 
-    def __init__(self):
+    def __init__(self, config: DetectorConfig = None):
         super().__init__()
-        weights, imgsz = args.weights, args.img_size
+        self.config = config = config or DetectorConfig()
         self.save_dir = 'output'
-        
-        # Load model
-        self.device = select_device(args.device)
-        self.model = attempt_load(weights, map_location=self.device)  # load FP32 model
-        self.stride = int(self.model.stride.max())  # model stride
-        self.imgsz = check_img_size(imgsz, s=self.stride)  # check img_size
-        self.names = self.model.module.names if hasattr(self.model, 'module') else self.model.names  # get class names
+
+        # Load model (shared with every other Detector using the same weights and device)
+        self.engine = FruitDetector(config)
+        self.names = self.engine.names  # get class names
+        self.batch_size = self.engine.batch_size  # video frames per forward pass
+        self.max_wait = self.engine.max_wait  # seconds before a partial batch is flushed
         self.last_detections = []  # Store last detections
         self.last_qualities = []   # Store last quality analyses
         self.last_nutritional_info = {}  # Store last nutritional info
         self.last_analysis = []    # Store complete analysis results
         self.last_frame = None
-        
-        # Initialize analyzers
-        self.fruit_analyzer = FruitAnalyzer()
-        self.report_generator = ReportGenerator()
+        self.tracker = self.engine.new_tracker()  # follows fruits across the frames of a video
+        self.motion_gate = self.engine.new_motion_gate()  # skips inference on static video frames
+        self.cameras = {}  # camera index -> (tracker, motion gate) for the other cameras of a live source
+
+        # Initialize report and export helpers
+        self.report_worker = ReportWorker(config.report_policy, config.report_interval,
+                                          callback=lambda path: self.signal_export_complete.emit(path, "PDF"))
         self.data_exporter = DataExporter()
-        
-        if self.device.type != 'cpu':
-            self.model(torch.zeros(1, 3, self.imgsz, self.imgsz).to(self.device).type_as(next(self.model.parameters())))  # run once
-    
-    def detect(self, img):
-        self.last_frame = img
-        original_image = img.copy()
-        t0 = time.time()
-        
-        # Preprocess image
-        img = letterbox(img)[0]
-        img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
-        img = np.ascontiguousarray(img)
-        img = torch.from_numpy(img).to(self.device)
-        img = img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-        img = img.unsqueeze(0)
-
-        # Inference
-        pred = self.model(img, augment=False)[0]
-
-        # Apply NMS
-        pred = non_max_suppression(pred, args.conf_thres, args.iou_thres, classes=args.classes, agnostic=args.agnostic_nms)
-
-        # Store detections
-        self.last_detections = pred
-        
-        # Process detections
-        detections_info = []
-        fruit_qualities = []
-        nutritional_info = {}
-        analysis_results = []
-        
-        for det in pred:  # detections per image
-            if len(det):
-                # Rescale boxes from img size to original_image size
-                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], original_image.shape).round()
-
-                # Process each detection
-                for *xyxy, conf, cls in reversed(det):
-                    c = int(cls)  # integer class
-                    fruit_name = self.names[c]
-                    
-                    # Convert tensor coordinates to integers
-                    x1, y1, x2, y2 = map(int, xyxy)
-                    
-                    # Get nutritional info
-                    if fruit_name not in nutritional_info:
-                        nutritional_info[fruit_name] = get_nutritional_info(fruit_name)
-                    
-                    # Analyze fruit quality
-                    quality = self.fruit_analyzer.analyze_fruit(original_image, (x1, y1, x2, y2), fruit_name)
-                    fruit_qualities.append(quality)
-                    
-                    # Create analysis result
-                    analysis_result = {
-                        'name': fruit_name,
-                        'confidence': float(conf),
-                        'bbox': [x1, y1, x2, y2],
-                        'quality': quality,
-                        'nutritional_info': nutritional_info[fruit_name]
-                    }
-                    analysis_results.append(analysis_result)
-                    
-                    # Store detection info
-                    detections_info.append({
-                        'name': fruit_name,
-                        'confidence': float(conf),
-                        'bbox': [x1, y1, x2, y2],
-                        'quality': quality
-                    })
-                    
-                    # Draw box with quality info
-                    color = colors(c, True)
-                    plot_one_box(xyxy, original_image, label=None, color=color, line_thickness=3)  # Increased line thickness
-                    
-                    # Draw labels with quality info
-                    label = f"{fruit_name} {conf:.2f}"
-                    if nutritional_info[fruit_name]:
-                        label += f" | Cal: {nutritional_info[fruit_name]['calories']}kcal"
-                    label += f" | Quality: {quality.quality_score:.2f}"
-                    
-                    # Increase font size and thickness for better visibility
-                    font_scale = 1.5  # Increased from 1.0 to 1.5
-                    font_thickness = 4  # Increased from 3 to 4
-                    
-                    # Get text size to position it properly
-                    (text_width, text_height), baseline = cv2.getTextSize(
-                        label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness
-                    )
-                    
-                    # Draw background rectangle for text with padding
-                    padding = 10  # Added padding around text
-                    cv2.rectangle(
-                        original_image,
-                        (x1, y1 - text_height - padding),
-                        (x1 + text_width + padding, y1 + padding),
-                        color,
-                        -1
-                    )
-                    
-                    # Draw text with increased size
-                    cv2.putText(
-                        original_image,
-                        label,
-                        (x1 + padding//2, y1 - padding//2),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        font_scale,
-                        (255, 255, 255),  # White text for better contrast
-                        font_thickness
-                    )
-                    
-                    # Draw ripeness indicator
-                    ripeness_color = (
-                        int(255 * (1 - quality.ripeness_level)),  # More red for less ripe
-                        int(255 * quality.ripeness_level),        # More green for more ripe
-                        0
-                    )
-                    # Increased circle size and moved it further from text
-                    cv2.circle(original_image, (x1 + 30, y1 - text_height - 30), 12, ripeness_color, -1)
-        
-        # Store results for report generation and UI updates
-        self.last_qualities = fruit_qualities
-        self.last_nutritional_info = nutritional_info
-        self.last_analysis = analysis_results
-        
+        self.session = None  # SessionWriter of the running video or live session
+
+    def camera(self, index=0):
+        """(tracker, motion gate) of one camera of a multi-camera live source, camera 0 is the video's own."""
+        if index == 0:
+            return self.tracker, self.motion_gate
+        if index not in self.cameras:
+            self.cameras[index] = (self.engine.new_tracker(), self.engine.new_motion_gate())
+        return self.cameras[index]
+
+    def predict(self, frames, gate=False, cameras=None):
+        """Run one forward pass and NMS over a list of frames, see FruitDetector.predict().
+
+        Set gate for consecutive video frames so static frames reuse the previous detections. Frames of several
+        live cameras batched together pass the camera index of every frame.
+        """
+        if not gate or self.motion_gate is None:
+            return self.engine.predict(frames)
+        if cameras is None:
+            return self.engine.predict(frames, self.motion_gate)
+        return self.engine.predict(frames, [self.camera(c)[1] for c in cameras])
+
+    def _publish(self, image, result):
+        """Store the results of a frame, emit them and hand them to the report worker."""
+        self.last_detections = result['detections']
+        self.last_qualities = result['qualities']
+        self.last_nutritional_info = result['nutritional_info']
+        self.last_analysis = result['analysis']
+
         # Emit signals
-        self.signal_show_analysis.emit(detections_info)
-        self.signal_show_quality.emit(fruit_qualities)
-        self.signal_show_nutrition.emit(nutritional_info)
-        
-        # Generate report if there are detections
-        if detections_info:
-            report_path = self.report_generator.generate_report(
-                original_image,
-                detections_info,
-                fruit_qualities,
-                nutritional_info
+        self.signal_show_analysis.emit(result['detections_info'])
+        self.signal_show_quality.emit(result['qualities'])
+        self.signal_show_nutrition.emit(result['nutritional_info'])
+
+        # Queue report if there are detections
+        if result['detections_info']:
+            self.report_worker.submit(
+                image,
+                result['detections_info'],
+                result['qualities'],
+                result['nutritional_info'],
+                key=result.get('key')  # repeated images reuse their report
             )
-            self.signal_export_complete.emit(report_path, "PDF")
-        
-        print(f'Done. ({time.time() - t0:.3f}s)')
+
+    def analyze(self, img, det, track=False, camera=0, frame=None):
+        """Annotate a frame from its predictions and publish the results, see predict().
+
+        Set track for consecutive video frames so fruits keep their ID and analysis from frame to frame, every
+        camera of a live source has its own tracker. The results are appended to the session log, if one was
+        started, under the frame index.
+        """
+        self.last_frame = img
+        image, result = self.engine.annotate(img, det, self.camera(camera)[0] if track else None)
+        self._publish(image, result)
+        if self.session is not None:
+            self.session.write(result, frame, camera)
+        return image, result
+
+    def detect(self, img):
+        t0 = time.time()
+
+        self.last_frame = img
+        original_image, result = self.engine.process([img])[0]  # served from the result cache when possible
+        self._publish(original_image, result)
+
+        cache = self.engine.cache
+        print(f'Done. ({time.time() - t0:.3f}s)' + (f' {cache.stats()}' if cache is not None else ''))
         return original_image
 
+    def detect_batch(self, frames):
+        """Detect fruits on several frames with a single forward pass.
+
+        Returns a list of (annotated frame, results dict) tuples in input order.
+        """
+        if not frames:
+            return []
+        t0 = time.time()
+
+        outputs = self.engine.process(frames)
+        for frame, (image, result) in zip(frames, outputs):
+            self.last_frame = frame
+            self._publish(image, result)
+
+        print(f'Done. {len(frames)} frames ({time.time() - t0:.3f}s)')
+        return outputs
+
+    def start_session(self, source: str, fps: float = None):
+        """Log the detections of every frame passed to analyze() until end_session(), if config.session_log."""
+        self.end_session()
+        if self.config.session_log:
+            name = Path(source).stem if os.path.isfile(source) else 'live'
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.data_exporter.data_dir, f'session_{timestamp}_{name}.csv')
+            self.session = SessionWriter(filename, fps)
+
+    def end_session(self):
+        """Close the session log, call at the end of a video or when a live source is stopped."""
+        if self.session is not None:
+            filename = self.session.close()
+            self.session = None
+            self.signal_export_complete.emit(filename, "CSV")
+
+    def flush_reports(self):
+        """Call at the end of a video or image so per-video reports get written."""
+        self.report_worker.flush()
+
+    def close_reports(self):
+        """Write the queued reports and end the report thread, a later report starts it again."""
+        self.report_worker.close()
+
+    def request_report(self) -> bool:
+        """Generate a report of the last analyzed frame on demand."""
+        return self.report_worker.request()
+
     def export_data(self, format_type: str):
         """Export data in the specified format."""
         if not self.last_detections:
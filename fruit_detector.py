@@ -0,0 +1,360 @@
+"""
+Qt-free fruit detection and analysis core.
+
+Shared by the PySide6 Detector used by the GUI and by the headless batch CLI (analyze.py).
+"""
+
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import List, Optional, Union
+
+import numpy as np
+import cv2
+
+from models.backends import load_backend
+from utils.datasets import letterbox
+from utils.general import check_img_size, non_max_suppression, scale_coords
+from utils.plots import colors, plot_one_box
+from utils.nutritional_info import get_nutrition_table
+from utils.fruit_analysis import FruitAnalyzer
+from utils.analysis_pool import get_analysis_pool
+from utils.motion import MotionGate
+from utils.result_cache import content_hash, get_cache
+from utils.tiling import tiled_predict
+from utils.tracker import Tracker
+from utils.torch_utils import smart_inference_mode
+
+
+@dataclass
+class DetectorConfig:
+    weights: Union[str, List[str]] = 'weights/Fruits.pt'  # model.pt path(s)
+    img_size: int = 640  # inference size (pixels)
+    conf_thres: float = 0.25  # object confidence threshold
+    iou_thres: float = 0.45  # IoU threshold for NMS
+    device: str = ''  # cuda device, i.e. 0 or 0,1,2,3 or cpu
+    backend: str = 'auto'  # 'torch', 'onnx' or 'auto' (ONNX Runtime when available, else PyTorch)
+    intra_op_threads: int = 0  # ONNX Runtime threads within an operator, 0 for default
+    inter_op_threads: int = 0  # ONNX Runtime threads across operators, 0 for default
+    int8: bool = False  # use the INT8 model written by models/quantize.py (<weights>.int8.onnx)
+    channels_last: bool = False  # PyTorch backend only, channels_last memory format
+    classes: Optional[List[int]] = None  # optional list of class indices to keep
+    agnostic_nms: bool = False  # class-agnostic NMS
+    batch_size: int = 4  # video frames per forward pass
+    max_wait: float = 0.1  # seconds before a partial batch is flushed
+    report_policy: str = 'video'  # PDF report per 'frame', 'video', 'interval' or 'manual'
+    report_interval: float = 10.0  # seconds between reports for the 'interval' policy
+    track: bool = True  # track fruits across video frames, analyze each once and count unique fruits
+    track_max_age: int = 30  # frames a lost fruit is remembered for
+    reanalyze_iou: float = 0.8  # analyze a tracked fruit again when its box IoU with the analyzed one drops below
+    motion_gate: bool = False  # reuse the last detections on video frames where the scene did not change
+    motion_threshold: float = 0.002  # fraction of changed pixels that counts as motion
+    motion_refresh: int = 30  # run the model at least every this many frames
+    every_frame: bool = False  # GUI video playback: detect every frame even when slower than real time
+    max_skip: int = 8  # real time playback detects at least every this many frames, the others are interpolated
+    tile: int = 0  # tiled inference with tiles of this many pixels, 0 to letterbox whole frames
+    tile_overlap: float = 0.2  # overlap between neighbouring tiles (fraction of the tile size)
+    tile_batch: int = 8  # tiles per forward pass
+    cache_size: int = 128  # still images whose results are kept in memory, 0 to disable the result cache
+    cache_dir: str = ''  # optional on-disk result cache directory
+    cache_disk_mb: float = 512  # on-disk result cache size limit
+    analysis_workers: int = 0  # analyze the boxes of a frame on this many threads or processes, 0 to analyze inline
+    analysis_pool: str = 'thread'  # 'thread', or 'process' for headless batch runs (frames in shared memory)
+    roi_max_pixels: int = 0  # downsample fruit ROIs above this many pixels before color analysis, 0 for full size
+    session_log: bool = False  # GUI: append the detections of every video/live frame to a CSV in data/
+
+    @classmethod
+    def from_args(cls, opt):
+        """Build a config from an argparse namespace, ignoring options it does not know."""
+        return cls(**{f.name: getattr(opt, f.name) for f in fields(cls) if hasattr(opt, f.name)})
+
+
+class FruitDetector:
+    def __init__(self, config: DetectorConfig = None):
+        self.config = config = config or DetectorConfig()
+        self.conf_thres = config.conf_thres  # object confidence threshold
+        self.iou_thres = config.iou_thres  # IoU threshold for NMS
+        self.classes = config.classes  # optional list of class indices to keep
+        self.agnostic_nms = config.agnostic_nms
+        self.batch_size = max(config.batch_size, 1)  # video frames per forward pass
+        self.max_wait = config.max_wait  # seconds before a partial batch is flushed
+        self.reanalyze_iou = config.reanalyze_iou
+        self.tile = config.tile  # tile size (pixels), 0 to disable tiling
+
+        # Load model, or reuse the one already loaded by this process
+        self.backend = load_backend(config.weights, config.device, config.backend,
+                                    config.intra_op_threads, config.inter_op_threads, config.int8,
+                                    config.channels_last)
+        self.stride = self.backend.stride  # model stride
+        self.imgsz = check_img_size(config.img_size, s=self.stride)  # check img_size
+        self.names = self.backend.names  # get class names
+        self.nutrition = get_nutrition_table(self.names)  # numeric nutrients per class id
+
+        # Results of still images, keyed by frame content and everything that changes them
+        self.cache = get_cache(config.cache_size, config.cache_dir, config.cache_disk_mb) if config.cache_size else None
+        w = self.backend.weights
+        files = [Path(x) for x in (w if isinstance(w, (list, tuple)) else [w])]
+        self.cache_salt = repr((self.backend.name, [(str(f), f.stat().st_mtime if f.exists() else 0) for f in files], self.imgsz,
+                                self.conf_thres, self.iou_thres, self.classes, self.agnostic_nms, self.tile,
+                                config.tile_overlap, config.roi_max_pixels))
+
+        # Initialize analyzers
+        self.fruit_analyzer = FruitAnalyzer(config.roi_max_pixels)
+        self.analysis_pool = get_analysis_pool(config.analysis_workers, config.analysis_pool, config.roi_max_pixels) \
+            if config.analysis_workers else None
+
+    def new_motion_gate(self):
+        """MotionGate for one fixed camera video, or None if motion gating is disabled."""
+        c = self.config
+        return MotionGate(c.motion_threshold, refresh=c.motion_refresh) if c.motion_gate else None
+
+    def new_tracker(self):
+        """Tracker for one video, or None if tracking is disabled."""
+        return Tracker(max_age=self.config.track_max_age) if self.config.track else None
+
+    def preprocess(self, frames):
+        """Letterbox a list of BGR frames and stack them into one uint8 RGB BCHW array for the backend."""
+        if self.backend.fixed_shape:  # model exported for a single input size
+            imgs = [letterbox(f, self.backend.fixed_shape, auto=False)[0] for f in frames]
+        else:
+            rect = len({f.shape for f in frames}) == 1  # minimal padding only when every frame has the same shape
+            imgs = [letterbox(f, self.imgsz, auto=rect, stride=self.stride)[0] for f in frames]
+        img = np.stack(imgs, 0)[:, :, :, ::-1].transpose(0, 3, 1, 2)  # BGR to RGB, to bsx3x416x416
+        return np.ascontiguousarray(img)
+
+    @smart_inference_mode()
+    def predict(self, frames, gate=None):
+        """Run one forward pass and NMS over a list of frames.
+
+        With a MotionGate (consecutive frames of a fixed camera), frames where the scene did not change reuse the
+        detections of the last inferred frame, pass a list with one MotionGate per frame for frames of several
+        cameras. With config.tile, every frame is inferred as overlapping tiles. Returns one detection tensor (n, 6)
+        per frame with boxes rescaled to that frame's shape.
+        """
+        if gate is not None:
+            gates = gate if isinstance(gate, (list, tuple)) else [gate] * len(frames)
+            changed = [g.changed(f) for g, f in zip(gates, frames)]
+            pred = iter(self.predict([f for f, c in zip(frames, changed) if c]) if any(changed) else [])
+            out = []
+            for g, c in zip(gates, changed):
+                if c:
+                    g.last = next(pred)
+                out.append(g.last.clone())
+            return out
+
+        if self.tile:  # high resolution frames, each one split into tiles run at the model input size
+            c = self.config
+            return [tiled_predict(self._predict, f, c.tile, c.tile_overlap, c.tile_batch, agnostic=self.agnostic_nms)
+                    for f in frames]
+        return self._predict(frames)
+
+    def _predict(self, frames):
+        # One forward pass over whole frames
+        img = self.preprocess(frames)
+
+        # Inference
+        pred = self.backend(img)
+
+        # Apply NMS
+        pred = non_max_suppression(pred, self.conf_thres, self.iou_thres, classes=self.classes, agnostic=self.agnostic_nms)
+
+        # Rescale boxes from img size to original frame size
+        for det, frame in zip(pred, frames):
+            if len(det):
+                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], frame.shape).round()
+        return pred
+
+    def detection_boxes(self, det):
+        """Integer xyxy boxes and class names of a frame's detections, in analysis order (reversed NMS order)."""
+        rdet = reversed(det)
+        bboxes = [tuple(map(int, xyxy)) for xyxy in rdet[:, :4].tolist()]
+        return bboxes, [self.names[int(c)] for c in rdet[:, 5].tolist()]
+
+    def analyze_fruits(self, img, bboxes, fruit_names):
+        """FruitQuality of every box of a frame, on the analysis pool if enabled, in box order."""
+        if self.analysis_pool is not None and len(bboxes) > 1:
+            return self.analysis_pool.analyze(img, bboxes, fruit_names)
+        return self.fruit_analyzer.analyze_fruits(img, bboxes, fruit_names)
+
+    def analyze_batch(self, frames, pred, tracker=None):
+        """analyze_detections() of several frames, their boxes all go to the analysis pool in one call."""
+        qualities = [None] * len(frames)
+        if self.analysis_pool is not None and tracker is None and len(frames) > 1:
+            boxes = [self.detection_boxes(det) for det in pred]
+            qualities = self.analysis_pool.analyze_frames(frames, [b for b, _ in boxes], [n for _, n in boxes])
+        return [self.analyze_detections(frame, det, tracker, q) for frame, det, q in zip(frames, pred, qualities)]
+
+    def analyze_detections(self, img, det, tracker=None, qualities=None):
+        """Analyze quality and look up nutrition for the detections of a single frame.
+
+        With a Tracker (consecutive video frames), every detection gets a track ID and a fruit is only analyzed
+        again when its box changed since its last analysis. Pass qualities when the boxes were already analyzed
+        (see analyze_batch()). Returns a dict with the per-frame results, the frame itself is left untouched.
+        Nutrient totals use the estimated weight of every fruit, per frame and, with a Tracker, over the unique
+        fruits of the whole video.
+        """
+        detections_info = []
+        fruit_qualities = []
+        nutritional_info = {}
+        analysis_results = []
+        tracks = []
+        classes = reversed(det[:, 5]).long().cpu().numpy()
+
+        if tracker is not None:
+            tracks = tracker.update(det[:, :4].cpu().numpy(), det[:, 5].cpu().numpy())[::-1]  # reversed like rdet
+
+        if len(det):
+            # Convert tensor coordinates to integers
+            rdet = reversed(det)
+            bboxes, fruit_names = self.detection_boxes(det)
+
+            # Analyze the quality of every new or changed fruit
+            if tracks:
+                boxes = np.array(bboxes, dtype=float)
+                todo = [i for i, t in enumerate(tracks) if t.needs_analysis(boxes[i], self.reanalyze_iou)]
+                qualities = self.analyze_fruits(img, [bboxes[i] for i in todo], [fruit_names[i] for i in todo])
+                for i, quality in zip(todo, qualities):
+                    tracks[i].set_quality(quality, boxes[i])
+                fruit_qualities = [t.quality for t in tracks]
+            elif qualities is not None:
+                fruit_qualities = qualities
+            else:
+                fruit_qualities = self.analyze_fruits(img, bboxes, fruit_names)
+            nutrients = self.nutrition.per_fruit(classes, [q.estimated_weight for q in fruit_qualities])
+
+            # Process each detection
+            for i, (c, conf, (x1, y1, x2, y2), quality) in enumerate(zip(classes.tolist(), rdet[:, 4].tolist(),
+                                                                          bboxes, fruit_qualities)):
+                fruit_name = self.names[c]
+
+                # Get nutritional info
+                if fruit_name not in nutritional_info:
+                    nutritional_info[fruit_name] = self.nutrition.info[c]
+
+                # Create analysis result
+                analysis_result = {
+                    'name': fruit_name,
+                    'class': c,
+                    'confidence': conf,
+                    'bbox': [x1, y1, x2, y2],
+                    'quality': quality,
+                    'nutritional_info': nutritional_info[fruit_name],
+                    'kcal': float(nutrients[i, 0]),  # estimated for this fruit's weight
+                    'track_id': tracks[i].id if tracks else None
+                }
+                analysis_results.append(analysis_result)
+
+                # Store detection info
+                detections_info.append({
+                    'name': fruit_name,
+                    'confidence': conf,
+                    'bbox': [x1, y1, x2, y2],
+                    'quality': quality
+                })
+
+        result = {
+            'detections': [det],  # same layout as the NMS output for a batch of one
+            'detections_info': detections_info,
+            'qualities': fruit_qualities,
+            'nutritional_info': nutritional_info,
+            'analysis': analysis_results,
+            'nutrition_totals': self.nutrition.totals(classes, [q.estimated_weight for q in fruit_qualities])
+        }
+        if tracker is not None:
+            result['counts'] = {self.names[c]: n for c, n in tracker.counts.items()}  # unique fruits so far
+            for t in tracks:
+                if t.hits >= tracker.min_hits:  # counted fruits, weight of their latest analysis
+                    tracker.weights[t.id] = (t.cls, t.quality.estimated_weight)
+            cls, grams = zip(*tracker.weights.values()) if tracker.weights else ((), ())
+            result['session_nutrition'] = self.nutrition.totals(cls, grams)
+        return result
+
+    def draw(self, img, result):
+        """Draw boxes, labels and ripeness indicators of a frame's results on a copy of the frame."""
+        original_image = img.copy()
+
+        for analysis in result['analysis']:
+            fruit_name, conf, quality = analysis['name'], analysis['confidence'], analysis['quality']
+            nutrition = analysis['nutritional_info']
+            x1, y1, x2, y2 = analysis['bbox']
+
+            # Draw box with quality info
+            color = colors(analysis['class'], True)
+            plot_one_box((x1, y1, x2, y2), original_image, label=None, color=color, line_thickness=3)  # Increased line thickness
+
+            # Draw labels with quality info
+            label = f"{fruit_name} {conf:.2f}"
+            if nutrition:
+                label += f" | Cal: {nutrition['calories']}kcal"
+            label += f" | Quality: {quality.quality_score:.2f}"
+
+            # Increase font size and thickness for better visibility
+            font_scale = 1.5  # Increased from 1.0 to 1.5
+            font_thickness = 4  # Increased from 3 to 4
+
+            # Get text size to position it properly
+            (text_width, text_height), baseline = cv2.getTextSize(
+                label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness
+            )
+
+            # Draw background rectangle for text with padding
+            padding = 10  # Added padding around text
+            cv2.rectangle(
+                original_image,
+                (x1, y1 - text_height - padding),
+                (x1 + text_width + padding, y1 + padding),
+                color,
+                -1
+            )
+
+            # Draw text with increased size
+            cv2.putText(
+                original_image,
+                label,
+                (x1 + padding//2, y1 - padding//2),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                font_scale,
+                (255, 255, 255),  # White text for better contrast
+                font_thickness
+            )
+
+            # Draw ripeness indicator
+            ripeness_color = (
+                int(255 * (1 - quality.ripeness_level)),  # More red for less ripe
+                int(255 * quality.ripeness_level),        # More green for more ripe
+                0
+            )
+            # Increased circle size and moved it further from text
+            cv2.circle(original_image, (x1 + 30, y1 - text_height - 30), 12, ripeness_color, -1)
+
+        return original_image
+
+    def annotate(self, img, det, tracker=None):
+        """Analyze and draw the detections of a single frame.
+
+        Returns the annotated copy of the frame and a dict with the per-frame results.
+        """
+        result = self.analyze_detections(img, det, tracker)
+        return self.draw(img, result), result
+
+    def process(self, frames, draw=True, tracker=None, gate=None):
+        """Detect and analyze a list of frames with one forward pass.
+
+        Pass a Tracker and/or MotionGate when the frames are consecutive frames of one video. Otherwise results
+        are looked up in and added to the result cache. Returns a list of (annotated frame or None if draw=False,
+        results dict) tuples in input order.
+        """
+        if not frames:
+            return []
+        if self.cache is None or tracker is not None or gate is not None:  # video frames are never cached
+            results = self.analyze_batch(frames, self.predict(frames, gate), tracker)
+        else:
+            keys = [content_hash(frame, self.cache_salt) for frame in frames]
+            results = [self.cache.get(k) for k in keys]
+            todo = [i for i, r in enumerate(results) if r is None]
+            if todo:
+                new = [frames[i] for i in todo]
+                for i, result in zip(todo, self.analyze_batch(new, self.predict(new))):
+                    results[i] = result
+                    results[i]['key'] = keys[i]  # lets consumers recognize repeated frames
+                    self.cache.put(keys[i], results[i])
+        return [(self.draw(frame, r) if draw else None, r) for frame, r in zip(frames, results)]
@@ -1,61 +1,299 @@
+import argparse
+import math
 import sys
 import os
+import time
+from threading import Thread
 from PySide6.QtWidgets import (QApplication, QMainWindow, QFileDialog, QMessageBox, 
                               QTextEdit, QDockWidget, QVBoxLayout, QWidget)
-from PySide6.QtCore import QFile, Qt
+from PySide6.QtCore import QFile, Qt, QEvent
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtGui import QPixmap, QImage, QAction
-from PySide6.QtCore import QThread, Signal, QDir
+from PySide6.QtCore import QThread, Signal, QDir, QTimer
 import cv2
+import numpy as np
+import torch
 from detector import Detector
-from utils.nutritional_info import get_nutritional_info, format_nutritional_info
+from fruit_detector import DetectorConfig
+from models.backends import load_backend
+from utils.datasets import LoadLatestStreams, is_stream
+from utils.general import check_requirements
+from utils.report_generator import ReportWorker
+from utils.pipeline import FanOut, Pipeline, Stage, video_frames, format_stats
+from utils.scheduler import FrameScheduler, interpolate_result
+from utils.panels import (Panel, analysis_state, nutrition_state, quality_state, render_analysis,
+                          render_nutrition)
 from collections import Counter, defaultdict
 
 
 def convertCVImage2QtImage(cv_img):
-    cv_img = cv2.cvtColor(cv_img, cv2.COLOR_BGR2RGB)
-    height, width, channel = cv_img.shape
-    bytesPerLine = 3 * width
-    qimg = QImage(cv_img.data, width, height, bytesPerLine, QImage.Format_RGB888)
+    # Wrap the BGR buffer as is (no color conversion copy), QPixmap.fromImage() makes the only copy
+    height, width = cv_img.shape[:2]
+    qimg = QImage(cv_img.data, width, height, cv_img.strides[0], QImage.Format_BGR888)
     return QPixmap.fromImage(qimg)
 
 
+def fit_frame(frame, size, smooth=False):
+    # Resize a BGR frame to fit size (width, height) keeping its aspect ratio. Run on worker threads so only
+    # widget-sized images reach the GUI thread. Fast bilinear during playback, area averaging for still frames
+    if not size or min(size) <= 0:
+        return frame
+    h, w = frame.shape[:2]
+    r = min(size[0] / w, size[1] / h)
+    new = (max(round(w * r), 1), max(round(h * r), 1))
+    if new == (w, h):
+        return frame
+    return cv2.resize(frame, new, interpolation=cv2.INTER_AREA if smooth and r < 1 else cv2.INTER_LINEAR)
+
+
+def mosaic(frames):
+    # Grid of the latest frame of every camera (None before its first frame), cells have the first frame's size
+    available = [f for f in frames if f is not None]
+    if len(frames) == 1 or not available:
+        return available[0] if available else None
+    h, w = available[0].shape[:2]
+    cols = math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / cols)
+    grid = np.zeros((rows * h, cols * w, 3), dtype=np.uint8)
+    for k, f in enumerate(frames):
+        if f is not None:
+            r, c = divmod(k, cols)
+            grid[r * h:(r + 1) * h, c * w:(c + 1) * w] = f if f.shape[:2] == (h, w) else cv2.resize(f, (w, h))
+    return grid
+
+
+def merge_results(results):
+    # Results of the latest frame of every camera as one frame's results, unique fruit counts are summed
+    results = [r for r in results if r is not None]
+    if len(results) == 1:
+        return results[0]
+    merged = {'detections': [d for r in results for d in r['detections']],
+              'analysis': [a for r in results for a in r['analysis']],
+              'qualities': [q for r in results for q in r['qualities']]}
+    if any('counts' in r for r in results):
+        merged['counts'] = dict(sum((Counter(r.get('counts', {})) for r in results), Counter()))
+    return merged
+
+
 class ProcessImage(QThread):
     signal_show_frame = Signal(object)
     signal_show_nutrition = Signal(list)
     signal_show_analysis = Signal(list)
     signal_show_quality = Signal(list)
+    signal_show_stats = Signal(str)
+    signal_show_counts = Signal(dict)
+    signal_show_input = Signal(object)
 
-    def __init__(self, fileName):
+    def __init__(self, fileName, config=None, queue_size=8, live=False, preview_every=2):
         QThread.__init__(self)
         self.fileName = fileName
-        self.detector = Detector()
+        self.sources = [x.strip() for x in fileName.split(';') if x.strip()] or [fileName]  # ';' separated cameras
+        live = live or is_stream(self.sources[0])
+        self.queue_size = queue_size  # max frames waiting between two pipeline stages
+        self.live = live  # live sources drop their oldest frames instead of blocking the decoder
+        self.preview_every = preview_every  # input preview shows every n-th decoded frame
+        self.pipeline = None
+        self.decoder = None
+        self.grabber = None  # newest frames of live cameras
+        self.scheduler = None  # picks the video frames that are detected, the others are interpolated
+        self.pending, self.previous = [], None  # skipped (index, frame) and last detected (index, result)
+        self.late = 0  # frames not shown because they were already late
+        self.frame = None
+        self.input_size = None  # (width, height) of the preview and output widgets, kept up to date by MainWindow
+        self.output_size = None
+        self.detector = Detector(config)  # reuses the model already loaded for this config
 
     def run(self):
-        if self.fileName.lower().endswith(('.mp4', '.avi')):
-            self.video = cv2.VideoCapture(self.fileName)
-            while True:
-                valid, self.frame = self.video.read()
-                if valid is not True:
-                    break
-                self.frame = self.detector.detect(self.frame)
-                self.signal_show_frame.emit(self.frame)
-                self.signal_show_nutrition.emit(self.detector.last_detections)
-                self.signal_show_analysis.emit(self.detector.last_analysis)
-                self.signal_show_quality.emit(self.detector.last_qualities)
-                cv2.waitKey(30)
-            self.video.release()
+        try:
+            if is_stream(self.sources[0]):
+                self.run_streams(self.sources)
+            elif self.fileName.lower().endswith(('.mp4', '.avi')):
+                self.video = cv2.VideoCapture(self.fileName)
+                try:
+                    self.run_pipeline()
+                finally:
+                    self.video.release()
+            else:
+                # Process single image
+                self.frame = cv2.imread(self.fileName)
+                if self.frame is not None:
+                    self.frame = self.detector.detect(self.frame)
+                    self.emit_results(self.frame)
+        finally:  # the session log and reports are completed even when processing fails
+            self.detector.end_session()
+            self.detector.flush_reports()
+            self.detector.close_reports()
+
+    def run_pipeline(self):
+        # decode -> infer (batched) -> annotate -> interpolate run on their own threads, this thread paces and emits.
+        # Frames are decoded once and shared by the input preview and the detection pipeline
+        fps = self.video.get(cv2.CAP_PROP_FPS) or 30
+        config = self.detector.engine.config
+        self.scheduler = FrameScheduler(fps, config.max_skip, enabled=not config.every_frame)
+        self.detector.start_session(self.fileName, fps)
+        self.decoder = FanOut(video_frames(self.video))
+        self.decoder.listen(lambda item: self.signal_show_input.emit(fit_frame(item[1], self.input_size)),
+                            every=self.preview_every)
+        frames = self.decoder.subscribe(self.queue_size, drop_oldest=self.live)
+        self.decoder.start()
+        self.pipeline = Pipeline(frames, [
+            Stage('infer', self.infer, self.detector.batch_size, self.detector.max_wait),
+            Stage('annotate', self.annotate),
+            Stage('interpolate', self.interpolate, flush=self.flush_interpolated)
+        ], maxsize=self.queue_size, drop_oldest=self.live).start()
+
+        # Real time playback drops the frames that are already late, every-frame mode shows all of them
+        realtime = self.scheduler.enabled
+        t_start, t_stats, last = None, 0.0, None
+        for i, self.frame, result in self.pipeline:
+            if t_start is None:
+                t_start = time.time() - i / fps
+            delay = t_start + i / fps - time.time()
+            if not self.live:  # play back at the video's own frame rate
+                time.sleep(max(delay, 0))
+            if realtime and delay < -1 / fps:
+                self.late += 1
+                last = result
+                continue
+            self.emit_results(self.frame, result)
+            last = None
+            if time.time() - t_stats > 1:
+                t_stats = time.time()
+                self.signal_show_stats.emit(self.stats())
+        if self.frame is not None:  # leave a smooth last frame on screen
+            if last is not None:
+                self.emit_results(self.frame, last)
+            self.signal_show_frame.emit(fit_frame(self.frame, self.output_size, smooth=True))
+        self.signal_show_stats.emit(self.stats())
+        print(f'Pipeline: {self.stats()}')
+
+    def run_streams(self, sources):
+        # Live cameras until stop(): only the newest frame of every camera is processed, frames of all cameras are
+        # batched into one inference call and shown side by side
+        n = len(sources)
+        raw, shown, results = [None] * n, [None] * n, [None] * n
+        self.grabber = LoadLatestStreams(sources)
+        self.detector.start_session(self.fileName)
+
+        def frames():
+            for _, items in self.grabber:
+                for camera, frame in items:
+                    yield camera, frame
+
+        def preview(item):
+            raw[item[0]] = item[1]
+            self.signal_show_input.emit(fit_frame(mosaic(raw), self.input_size))
+
+        self.decoder = FanOut(frames())
+        self.decoder.listen(preview, every=self.preview_every)
+        frames = self.decoder.subscribe(n, drop_oldest=True)
+        self.decoder.start()
+        self.pipeline = Pipeline(frames, [
+            Stage('infer', self.infer_streams, max(self.detector.batch_size, n), self.detector.max_wait),
+            Stage('annotate', self.annotate_streams)
+        ], maxsize=n, drop_oldest=True).start()
+
+        t_stats = 0.0
+        for camera, image, result in self.pipeline:
+            shown[camera], results[camera] = image, result
+            self.frame = mosaic(shown)
+            self.emit_results(self.frame, merge_results(results))
+            if time.time() - t_stats > 1:
+                t_stats = time.time()
+                self.signal_show_stats.emit(self.stats())
+        print(f'Pipeline: {self.stats()}')
+
+    def infer_streams(self, items):
+        cameras = [camera for camera, _ in items]
+        dets = self.detector.predict([frame for _, frame in items], gate=True, cameras=cameras)
+        return [(camera, frame, det) for (camera, frame), det in zip(items, dets)]
+
+    def annotate_streams(self, items):
+        return [(camera, *self.detector.analyze(frame, det, track=True, camera=camera))
+                for camera, frame, det in items]
+
+    def stats(self):
+        s = format_stats(self.pipeline.stats())
+        gate = self.detector.motion_gate
+        if gate is not None:
+            s += f' | static: {gate.skipped} skipped'
+        if self.grabber is not None:
+            reconnects = sum(x.reconnects for x in self.grabber.streams)
+            s += f' | cameras: {len(self.grabber)}' + (f' ({reconnects} reconnects)' if reconnects else '')
+        if self.scheduler is not None:
+            s += f' | {self.scheduler}'
+            if self.scheduler.skipped or self.late:
+                s += f' ({self.scheduler.skipped} interpolated, {self.late} late)'
+        return s
+
+    def infer(self, items):
+        # Frames the scheduler skips pass through without detections
+        todo = [(i, frame) for i, frame in items if self.scheduler.detect(i)]
+        t = time.time()
+        dets = dict(zip((i for i, _ in todo), self.detector.predict([f for _, f in todo], gate=True))) if todo else {}
+        self.scheduler.update('infer', time.time() - t, len(todo))
+        return [(i, frame, dets.get(i)) for i, frame in items]
+
+    def annotate(self, items):
+        out = []
+        for i, frame, det in items:
+            if det is None:
+                out.append((i, frame, None))
+                continue
+            t = time.time()
+            out.append((i, *self.detector.analyze(frame, det, track=True, frame=i)))
+            self.scheduler.update('annotate', time.time() - t)
+        return out
+
+    def interpolate(self, items):
+        # Skipped frames wait for the next detected frame, their boxes are interpolated between the two
+        out = []
+        for i, image, result in items:
+            if result is None:
+                self.pending.append((i, image))
+                continue
+            out += self.draw_pending((i, result))
+            self.previous = (i, result)
+            out.append((i, image, result))
+        return out
+
+    def flush_interpolated(self):
+        return self.draw_pending(None)  # end of the video, repeat the last detected frame
+
+    def draw_pending(self, following):
+        if not self.pending or self.previous is None:
+            return []
+        i0, previous = self.previous
+        i1, result = following or (None, None)
+        out = []
+        for i, frame in self.pending:
+            r = interpolate_result(previous, result, (i - i0) / (i1 - i0) if result is not None else 0.0)
+            out.append((i, self.detector.engine.draw(frame, r), r))
+        self.pending = []
+        return out
+
+    def emit_results(self, frame, result=None):
+        if result is None:  # results of the last detect() call
+            detections = self.detector.last_detections
+            analysis = self.detector.last_analysis
+            qualities = self.detector.last_qualities
         else:
-            # Process single image
-            self.frame = cv2.imread(self.fileName)
-            if self.frame is not None:
-                self.frame = self.detector.detect(self.frame)
-                self.signal_show_frame.emit(self.frame)
-                self.signal_show_nutrition.emit(self.detector.last_detections)
-                self.signal_show_analysis.emit(self.detector.last_analysis)
-                self.signal_show_quality.emit(self.detector.last_qualities)
+            detections, analysis, qualities = result['detections'], result['analysis'], result['qualities']
+        self.signal_show_frame.emit(fit_frame(frame, self.output_size, smooth=result is None))
+        if result is not None and 'counts' in result:  # tracked video, unique fruits so far
+            self.signal_show_counts.emit(result['counts'])
+        else:
+            self.signal_show_nutrition.emit(detections)
+        self.signal_show_analysis.emit(analysis)
+        self.signal_show_quality.emit(qualities)
 
     def stop(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.decoder is not None:
+            self.decoder.stop()
         try:
             self.video.release()
         except:
@@ -65,9 +303,10 @@ class ProcessImage(QThread):
 class show(QThread):
     signal_show_image = Signal(object)
 
-    def __init__(self, fileName):
+    def __init__(self, fileName, size=None):
         QThread.__init__(self)
         self.fileName = fileName
+        self.size = size  # (width, height) of the preview widget
         if self.fileName.lower().endswith(('.mp4', '.avi')):
             self.video = cv2.VideoCapture(self.fileName)
         else:
@@ -75,17 +314,15 @@ class show(QThread):
 
     def run(self): 
         if self.video is not None:
-            while True:
-                valid, self.frame = self.video.read()
-                if valid is not True:
-                    break
-                self.signal_show_image.emit(self.frame)
-                cv2.waitKey(30)
+            # First frame only, the rest of the preview comes from ProcessImage's decoder
+            valid, self.frame = self.video.read()
+            if valid is True:
+                self.signal_show_image.emit(fit_frame(self.frame, self.size, smooth=True))
             self.video.release()
         else:
             self.frame = cv2.imread(self.fileName)
             if self.frame is not None:
-                self.signal_show_image.emit(self.frame)
+                self.signal_show_image.emit(fit_frame(self.frame, self.size, smooth=True))
 
     def stop(self):
         try:
@@ -96,8 +333,15 @@ class show(QThread):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, config=None, ui_fps=10):
         super(MainWindow, self).__init__()
+        self.config = config or DetectorConfig()
+
+        # Load the model in the background so the first "Start" finds it warm
+        c = self.config
+        Thread(target=load_backend, daemon=True,
+               args=(c.weights, c.device, c.backend, c.intra_op_threads, c.inter_op_threads, c.int8,
+                     c.channels_last)).start()
         loader = QUiLoader()
         self.ui = loader.load("ui/form.ui")
         
@@ -111,10 +355,20 @@ class MainWindow(QMainWindow):
         self.ui.btn_browse.clicked.connect(self.getFile)
         self.ui.btn_start.clicked.connect(self.predict)
         
+        self.ui.lbl_input.installEventFilter(self)
+        self.ui.lbl_output.installEventFilter(self)
+
         # Initialize fruit history
         self.fruit_history = defaultdict(int)
         self.quality_history = defaultdict(list)
         self.analysis_history = defaultdict(list)
+
+        # Text panels are re-rendered at most ui_fps times per second, only when their content changed
+        self.nutrition_panel = Panel(self.ui.txt_nutrition)
+        self.analysis_panel = Panel(self.ui.txt_analysis)
+        self.panel_timer = QTimer(self)
+        self.panel_timer.timeout.connect(self.refresh_panels)
+        self.panel_timer.start(int(1000 / max(ui_fps, 0.1)))
         
         # Set initial status
         self.ui.statusbar.showMessage("Ready")
@@ -125,8 +379,8 @@ class MainWindow(QMainWindow):
         self.fruit_history.clear()
         self.quality_history.clear()
         self.analysis_history.clear()
-        self.ui.txt_analysis.clear()
-        self.ui.txt_nutrition.clear()
+        self.analysis_panel.clear()
+        self.nutrition_panel.clear()
         
         self.fileName = QFileDialog.getOpenFileName(
             self,
@@ -138,142 +392,106 @@ class MainWindow(QMainWindow):
         if self.fileName:
             self.ui.txt_address.setText(str(self.fileName))
             self.ui.statusbar.showMessage(f"Loaded: {os.path.basename(self.fileName)}")
-            self.show = show(self.fileName)
+            self.show = show(self.fileName, self.widget_size(self.ui.lbl_input))
             self.show.signal_show_image.connect(self.show_input)
             self.show.start()
         
     def predict(self):
-        if not hasattr(self, 'fileName') or not self.fileName:
-            QMessageBox.warning(self, "Warning", "Please select an image or video first!")
+        # The address may also be typed in: webcam indices or stream URLs, several cameras separated by ';'
+        source = self.ui.txt_address.text().strip() or getattr(self, 'fileName', '')
+        if not source:
+            QMessageBox.warning(self, "Warning", "Please select an image or video, or enter a camera or stream URL!")
             return
 
+        if hasattr(self, 'process_image') and self.process_image.isRunning():
+            live = self.process_image.live
+            self.process_image.stop()
+            self.process_image.wait()
+            if live:  # Start also stops a running live source
+                self.ui.statusbar.showMessage("Stopped")
+                return
+        if hasattr(self, 'process_image'):  # report thread restarted by an export of the previous results
+            Thread(target=self.process_image.detector.close_reports, daemon=True).start()  # off the GUI thread
+
+        self.fileName = source
         self.ui.statusbar.showMessage("Processing...")
-        self.process_image = ProcessImage(self.fileName)
+        self.process_image = ProcessImage(self.fileName, self.config)
         self.process_image.signal_show_frame.connect(self.show_output)
         self.process_image.signal_show_nutrition.connect(self.update_nutritional_info)
+        self.process_image.signal_show_counts.connect(self.update_counts)
+        self.process_image.signal_show_input.connect(self.show_input)
+        self.process_image.input_size = self.widget_size(self.ui.lbl_input)
+        self.process_image.output_size = self.widget_size(self.ui.lbl_output)
         self.process_image.signal_show_analysis.connect(self.update_analysis)
         self.process_image.signal_show_quality.connect(self.update_quality)
+        self.process_image.signal_show_stats.connect(self.ui.statusbar.showMessage)
+        self.process_image.detector.signal_export_complete.connect(self.export_complete)
         self.process_image.start()
 
     def show_input(self, image):
-        pixmap = convertCVImage2QtImage(image)
-        self.ui.lbl_input.setPixmap(pixmap.scaled(
-            self.ui.lbl_input.size(),
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        ))
+        # image was already resized to the label by the worker thread
+        self.ui.lbl_input.setPixmap(convertCVImage2QtImage(image))
 
     def show_output(self, image):
-        pixmap = convertCVImage2QtImage(image)
-        self.ui.lbl_output.setPixmap(pixmap.scaled(
-            self.ui.lbl_output.size(),
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        ))
+        self.ui.lbl_output.setPixmap(convertCVImage2QtImage(image))
         self.ui.statusbar.showMessage("Detection complete")
 
+    @staticmethod
+    def widget_size(widget):
+        return widget.width(), widget.height()
+
+    def eventFilter(self, obj, event):
+        # Keep the worker's target display sizes in sync with the labels
+        if event.type() == QEvent.Resize and hasattr(self, 'process_image'):
+            if obj is self.ui.lbl_input:
+                self.process_image.input_size = self.widget_size(obj)
+            elif obj is self.ui.lbl_output:
+                self.process_image.output_size = self.widget_size(obj)
+        return super().eventFilter(obj, event)
+
     def update_nutritional_info(self, detections):
         # Update current frame detections
-        current_fruits = Counter()
-        for det in detections:
-            if len(det):
-                for *_, cls in reversed(det):
-                    fruit_name = self.process_image.detector.names[int(cls)]
-                    current_fruits[fruit_name] += 1
-                    # Update history with new detections
-                    self.fruit_history[fruit_name] = max(self.fruit_history[fruit_name], current_fruits[fruit_name])
-
-        # Generate nutritional text using the history
-        if self.fruit_history:
-            nutritional_text = "<h3>Detected Fruits:</h3>"
-            for fruit, count in self.fruit_history.items():
-                info = get_nutritional_info(fruit)
-                if info:
-                    nutritional_text += f"<b>{fruit} (x{count})</b><br>"
-                    nutritional_text += format_nutritional_info(fruit, info) + "<br><br>"
-                else:
-                    nutritional_text += f"<b>{fruit} (x{count})</b>: No nutritional information available.<br><br>"
-            self.ui.txt_nutrition.setHtml(nutritional_text)
-        else:
-            self.ui.txt_nutrition.setText("No fruits detected.")
+        classes = torch.cat([det[:, 5] for det in detections]).long() if detections else torch.zeros(0, dtype=torch.long)
+        for c, n in enumerate(torch.bincount(classes).tolist()):
+            if n:
+                # Update history with new detections
+                fruit_name = self.process_image.detector.names[c]
+                self.fruit_history[fruit_name] = max(self.fruit_history[fruit_name], n)
+        self.show_nutrition()
+
+    def update_counts(self, counts):
+        # Unique fruits tracked so far in the video
+        self.fruit_history.clear()
+        self.fruit_history.update(counts)
+        self.show_nutrition()
+
+    def show_nutrition(self):
+        # Only records the state, the panel is rendered by the next UI refresh
+        self.nutrition_panel.update(nutrition_state(self.fruit_history), render_nutrition)
 
     def update_analysis(self, analysis_list):
-        if analysis_list:
-            analysis_text = "<h3>Fruit Analysis:</h3>"
-            for analysis in analysis_list:
-                fruit_name = analysis['name']
-                analysis_text += f"<b>{fruit_name}</b><br>"
-                analysis_text += f"Confidence: {analysis['confidence']:.2f}<br>"
-                
-                # Add quality information
-                quality = analysis['quality']
-                analysis_text += f"Quality Score: {quality.quality_score:.2f}<br>"
-                analysis_text += f"Ripeness Level: {quality.ripeness_level:.2f}<br>"
-                analysis_text += f"Estimated Weight: {quality.estimated_weight:.1f}g<br>"
-                
-                if quality.defects:
-                    analysis_text += "Defects Detected:<br>"
-                    for defect in quality.defects:
-                        analysis_text += f"- {defect}<br>"
-                
-                if quality.recommendations:
-                    analysis_text += "Recommendations:<br>"
-                    for rec in quality.recommendations:
-                        analysis_text += f"- {rec}<br>"
-                
-                # Add nutritional information
-                if analysis['nutritional_info']:
-                    nutr = analysis['nutritional_info']
-                    analysis_text += "<br>Nutritional Information:<br>"
-                    analysis_text += f"Calories: {nutr['calories']} kcal<br>"
-                    analysis_text += f"Protein: {nutr['protein']}g<br>"
-                    analysis_text += f"Carbs: {nutr['carbs']}g<br>"
-                    analysis_text += f"Fiber: {nutr['fiber']}g<br>"
-                    analysis_text += f"Vitamins: {', '.join(nutr['vitamins'])}<br>"
-                
-                analysis_text += "<br>"
-            self.ui.txt_analysis.setHtml(analysis_text)
-        else:
-            self.ui.txt_analysis.setText("No analysis available.")
+        self.analysis_panel.update(analysis_state(analysis_list), render_analysis)
 
     def update_quality(self, qualities):
-        if qualities:
-            quality_text = "<h3>Quality Analysis:</h3>"
-            # Get the current detections from the detector
-            if hasattr(self, 'process_image') and self.process_image.detector.last_analysis:
-                for analysis in self.process_image.detector.last_analysis:
-                    fruit_name = analysis['name']
-                    quality = analysis['quality']
-                    
-                    quality_text += f"<b>{fruit_name}</b><br>"
-                    quality_text += f"Quality Score: {quality.quality_score:.2f}<br>"
-                    quality_text += f"Ripeness Level: {quality.ripeness_level:.2f}<br>"
-                    quality_text += f"Estimated Weight: {quality.estimated_weight:.1f}g<br>"
-                    
-                    if quality.defects:
-                        quality_text += "Defects Detected:<br>"
-                        for defect in quality.defects:
-                            quality_text += f"- {defect}<br>"
-                    
-                    if quality.recommendations:
-                        quality_text += "Recommendations:<br>"
-                        for rec in quality.recommendations:
-                            quality_text += f"- {rec}<br>"
-                    
-                    quality_text += "<br>"
-            else:
-                quality_text += "No fruit analysis available."
-            self.ui.txt_analysis.setHtml(quality_text)
-        else:
-            self.ui.txt_analysis.setText("No quality analysis available.")
+        # Shares the analysis panel, the last update before a refresh wins
+        analysis = self.process_image.detector.last_analysis if hasattr(self, 'process_image') else None
+        self.analysis_panel.update(quality_state(qualities, analysis), render_analysis)
+
+    def refresh_panels(self):
+        self.nutrition_panel.flush()
+        self.analysis_panel.flush()
 
     def exportReport(self):
         if not hasattr(self, 'process_image') or not self.process_image.detector.last_detections:
             QMessageBox.warning(self, "Warning", "No analysis results to export!")
             return
             
-        # The report is already generated in the detector
-        QMessageBox.information(self, "Success", "Report has been generated in the 'reports' directory.")
+        # Reports are written by the detector's background worker
+        self.process_image.detector.request_report()
+        QMessageBox.information(self, "Success", "Report is being generated in the 'reports' directory.")
+
+    def export_complete(self, filename, file_type):
+        self.ui.statusbar.showMessage(f"{file_type} saved: {filename}")
 
     def showAbout(self):
         QMessageBox.about(self, "About",
@@ -288,7 +506,51 @@ class MainWindow(QMainWindow):
             "Version 1.0")
 
 
+def parse_opt():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', nargs='+', type=str, default='weights/Fruits.pt', help='model.pt path(s)')
+    parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='object confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='IOU threshold for NMS')
+    parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--backend', default='auto', choices=('auto', 'torch', 'onnx'),
+                        help='inference backend, auto uses ONNX Runtime on CPU if a .onnx model is available')
+    parser.add_argument('--intra-op-threads', type=int, default=0, help='ONNX Runtime intra-op threads, 0 for default')
+    parser.add_argument('--inter-op-threads', type=int, default=0, help='ONNX Runtime inter-op threads, 0 for default')
+    parser.add_argument('--int8', action='store_true', help='use the INT8 model made by models/quantize.py')
+    parser.add_argument('--channels-last', action='store_true', help='channels_last memory format (PyTorch backend)')
+    parser.add_argument('--classes', nargs='+', type=int, help='filter by class: --class 0, or --class 0 2 3')
+    parser.add_argument('--agnostic-nms', action='store_true', help='class-agnostic NMS')
+    parser.add_argument('--batch-size', type=int, default=4, help='video frames per inference batch (1 disables batching)')
+    parser.add_argument('--max-wait', type=float, default=0.1, help='max seconds to wait while filling a video batch')
+    parser.add_argument('--report-policy', default='video', choices=ReportWorker.policies,
+                        help='PDF report per frame, per video, per --report-interval or on demand (manual)')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='seconds between reports for --report-policy interval')
+    parser.add_argument('--no-track', dest='track', action='store_false', help='analyze every video frame independently')
+    parser.add_argument('--track-max-age', type=int, default=30, help='frames a lost fruit is remembered for')
+    parser.add_argument('--reanalyze-iou', type=float, default=0.8, help='re-analyze a tracked fruit below this box IoU')
+    parser.add_argument('--motion-gate', action='store_true', help='skip inference on video frames without motion')
+    parser.add_argument('--motion-threshold', type=float, default=0.002, help='fraction of changed pixels for motion')
+    parser.add_argument('--motion-refresh', type=int, default=30, help='run inference at least every n frames')
+    parser.add_argument('--tile', type=int, default=0, help='tiled inference tile size (pixels), 0 to disable')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='overlap between tiles (fraction)')
+    parser.add_argument('--tile-batch', type=int, default=8, help='tiles per forward pass')
+    parser.add_argument('--cache-size', type=int, default=128, help='images kept in the result cache, 0 to disable')
+    parser.add_argument('--cache-dir', type=str, default='', help='optional on-disk result cache directory')
+    parser.add_argument('--cache-disk-mb', type=float, default=512, help='on-disk result cache size limit (MB)')
+    parser.add_argument('--roi-max-pixels', type=int, default=0, help='downsample larger fruit ROIs for color analysis, 0 off')
+    parser.add_argument('--analysis-workers', type=int, default=0, help='threads analyzing the fruits of a frame, 0 inline')
+    parser.add_argument('--every-frame', action='store_true', help='detect every video frame even if slower than real time')
+    parser.add_argument('--max-skip', type=int, default=8, help='detect at least every n-th video frame in real time mode')
+    parser.add_argument('--session-log', action='store_true', help='append every video/live detection to a CSV in data/')
+    parser.add_argument('--ui-fps', type=float, default=10, help='max refresh rate of the analysis and nutrition panels')
+    opt, qt_args = parser.parse_known_args()  # leave Qt's own options to QApplication
+    return opt, sys.argv[:1] + qt_args
+
+
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = MainWindow()
+    opt, qt_args = parse_opt()
+    check_requirements(exclude=('tensorboard', 'pycocotools', 'thop'))
+    app = QApplication(qt_args)
+    window = MainWindow(DetectorConfig.from_args(opt), opt.ui_fps)
     sys.exit(app.exec())
@@ -0,0 +1,142 @@
+# Inference backends for the fruit detector
+
+import ast
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+import torch
+
+from models.experimental import attempt_load
+from utils.torch_utils import InputBuffer, prepare_model, select_device, smart_inference_mode
+
+
+class Backend:
+    # Runs a uint8 RGB BCHW numpy batch through a detection model and returns raw predictions (b, n, 5 + nc)
+    name = 'base'
+    stride = 32  # max model stride
+    names = []  # class names
+    fixed_shape = None  # (height, width) if the model only accepts one input size
+    weights = None  # model file(s) actually loaded
+    device = torch.device('cpu')
+
+    def __call__(self, img):
+        raise NotImplementedError
+
+
+class TorchBackend(Backend):
+    # Eager PyTorch model loaded with attempt_load() and prepared for inference
+    name = 'torch'
+
+    def __init__(self, weights, device='', channels_last=False):
+        self.weights = weights
+        self.device = select_device(device)
+        self.model = prepare_model(attempt_load(weights, map_location=self.device), channels_last)  # load FP32 model
+        self.stride = int(self.model.stride.max())  # model stride
+        self.names = self.model.module.names if hasattr(self.model, 'module') else self.model.names  # get class names
+        self.input = InputBuffer(channels_last)  # input tensor reused across calls
+        self.lock = Lock()  # the input buffer is shared by every caller of this backend
+        if self.device.type != 'cpu':
+            self(np.zeros((1, 3, 640, 640), dtype=np.uint8))  # run once
+
+    @smart_inference_mode()
+    def __call__(self, img):
+        with self.lock:
+            return self.model(self.input(img, self.device), augment=False)[0]
+
+
+class OnnxBackend(Backend):
+    # ONNX Runtime CPU session for models exported with models/export.py --include onnx
+    name = 'onnx'
+
+    def __init__(self, weights, intra_op_threads=0, inter_op_threads=0):
+        import onnxruntime as ort
+
+        self.weights = weights
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads  # 0 = onnxruntime default
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(weights), options, providers=['CPUExecutionProvider'])
+        self.input = self.session.get_inputs()[0]
+        self.output = self.session.get_outputs()[0].name  # detections, other outputs are raw feature maps
+
+        b, _, h, w = self.input.shape  # int for static axes, str for dynamic ones
+        self.fixed_batch = b if isinstance(b, int) else None
+        self.fixed_shape = (h, w) if isinstance(h, int) and isinstance(w, int) else None
+
+        meta = self.session.get_modelmeta().custom_metadata_map  # written by models/export.py
+        self.stride = int(meta.get('stride', 32))
+        if 'names' in meta:
+            self.names = ast.literal_eval(meta['names'])
+        else:
+            nc = self.session.get_outputs()[0].shape[-1] - 5
+            self.names = [f'class{i}' for i in range(nc)]
+            print(f'WARNING: {weights} has no class names, re-export it with models/export.py')
+
+    def __call__(self, img):
+        x = img.astype(np.float32) / 255.0  # uint8 to fp32, 0 - 255 to 0.0 - 1.0
+        if self.fixed_batch == 1 and len(x) > 1:  # static batch: one image per run
+            y = np.concatenate([self.session.run([self.output], {self.input.name: xi[None]})[0] for xi in x], 0)
+        else:
+            y = self.session.run([self.output], {self.input.name: x})[0]
+        return torch.from_numpy(y)
+
+
+_backends = {}  # cache key -> Backend, shared by every detector of the process
+_backends_lock = Lock()
+
+
+def onnx_available():
+    try:
+        import onnxruntime
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_backend(weights, backend='auto', int8=False, device=''):
+    # Returns (backend name, weights) to load. 'auto' prefers ONNX Runtime when it is installed, an ONNX model is
+    # given or sits next to the .pt weights and the model runs on the CPU (device 'cpu', or '' without CUDA), and
+    # falls back to PyTorch otherwise. int8 picks the *.int8.onnx model written by models/quantize.py instead of the
+    # FP32 one
+    w = weights[0] if isinstance(weights, (list, tuple)) and len(weights) == 1 else weights
+    if backend == 'torch' or isinstance(w, (list, tuple)):
+        return 'torch', weights
+    w = Path(w)
+    stem = w.stem[:-len('.int8')] if w.stem.endswith('.int8') else w.stem  # Fruits.int8.onnx -> Fruits
+    pt = w.with_name(stem + '.pt')
+    onnx = w if w.suffix == '.onnx' else w.with_name(stem + ('.int8.onnx' if int8 else '.onnx'))
+    if backend == 'onnx':
+        return 'onnx', onnx
+    device = str(device).lower().replace('cuda:', '').strip()
+    cpu = device == 'cpu' or (device == '' and not torch.cuda.is_available())
+    if not cpu and (w.suffix != '.onnx' or pt.exists()):  # CUDA requested or available, ONNX backend is CPU only
+        return 'torch', pt if w.suffix == '.onnx' else weights
+    if onnx_available() and onnx.exists():
+        if not cpu:
+            print(f'WARNING: {pt} not found, running {onnx} with ONNX Runtime on CPU')
+        return 'onnx', onnx
+    if w.suffix == '.onnx':  # onnxruntime missing, try the PyTorch weights of the same model
+        print('WARNING: onnxruntime not installed, falling back to PyTorch weights')
+        return 'torch', pt
+    if int8:
+        print(f'WARNING: {onnx} not found, run models/quantize.py first. Using FP32 weights')
+    return 'torch', weights
+
+
+def load_backend(weights, device='', backend='auto', intra_op_threads=0, inter_op_threads=0, int8=False,
+                 channels_last=False):
+    # Load a model once per process and settings, later calls return the same warm backend
+    name, w = resolve_backend(weights, backend, int8, device)
+    if name == 'onnx':
+        if backend == 'onnx':
+            assert str(device).lower() in ('', 'cpu'), 'ONNX backend runs on CPU only, use --backend torch for CUDA'
+        key = (name, str(w), intra_op_threads, inter_op_threads)
+    else:
+        key = (name, tuple(w) if isinstance(w, (list, tuple)) else (str(w),), str(device), channels_last)
+    with _backends_lock:
+        if key not in _backends:
+            _backends[key] = OnnxBackend(w, intra_op_threads, inter_op_threads) if name == 'onnx' else \
+                TorchBackend(w, device, channels_last)
+        return _backends[key]
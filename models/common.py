@@ -15,7 +15,7 @@ from torch.cuda import amp
 from utils.datasets import letterbox
 from utils.general import non_max_suppression, make_divisible, scale_coords, increment_path, xyxy2xywh, save_one_box
 from utils.plots import colors, plot_one_box
-from utils.torch_utils import time_synchronized
+from utils.torch_utils import time_synchronized, prepare_model, InputBuffer, smart_inference_mode
 
 
 def autopad(k, p=None):  # kernel, padding
@@ -231,13 +231,14 @@ class AutoShape(nn.Module):
 
     def __init__(self, model):
         super(AutoShape, self).__init__()
-        self.model = model.eval()
+        self.model = prepare_model(model)  # fused, eval, no gradients
+        self.inputs = InputBuffer()  # input tensor reused across calls
 
     def autoshape(self):
         print('AutoShape already enabled, skipping... ')  # model already converted to model.autoshape()
         return self
 
-    @torch.no_grad()
+    @smart_inference_mode()
     def forward(self, imgs, size=640, augment=False, profile=False):
         # Inference from various sources. For height=640, width=1280, RGB images example inputs are:
         #   filename:   imgs = 'data/images/zidane.jpg'
@@ -276,7 +277,7 @@ class AutoShape(nn.Module):
         x = [letterbox(im, new_shape=shape1, auto=False)[0] for im in imgs]  # pad
         x = np.stack(x, 0) if n > 1 else x[0][None]  # stack
         x = np.ascontiguousarray(x.transpose((0, 3, 1, 2)))  # BHWC to BCHW
-        x = torch.from_numpy(x).to(p.device).type_as(p) / 255.  # uint8 to fp16/32
+        x = self.inputs(x, p.device, p.dtype)  # uint8 to fp16/32, 0 - 255 to 0.0 - 1.0
         t.append(time_synchronized())
 
         with amp.autocast(enabled=p.device.type != 'cpu'):
@@ -21,6 +21,61 @@ from utils.activations import Hardswish, SiLU
 from utils.general import colorstr, check_img_size, check_requirements, file_size, set_logging
 from utils.torch_utils import select_device
 
+
+def prepare_export(model, inplace=False, dynamic=False):
+    # Update a loaded model in place for tracing
+    for k, m in model.named_modules():
+        m._non_persistent_buffers_set = set()  # pytorch 1.6.0 compatibility
+        if isinstance(m, models.common.Conv):  # assign export-friendly activations
+            if isinstance(m.act, nn.Hardswish):
+                m.act = Hardswish()
+            elif isinstance(m.act, nn.SiLU):
+                m.act = SiLU()
+        elif isinstance(m, models.yolo.Detect):
+            m.inplace = inplace
+            m.onnx_dynamic = dynamic
+            # m.forward = m.forward_export  # assign forward (optional)
+    return model
+
+
+def export_onnx(model, img, f, opset_version=12, dynamic=False, simplify=False, prefix=colorstr('ONNX:')):
+    # Export a prepared model to ONNX file f, returns f
+    import onnx
+
+    print(f'{prefix} starting export with onnx {onnx.__version__}...')
+    torch.onnx.export(model, img, f, verbose=False, opset_version=opset_version, input_names=['images'],
+                      dynamic_axes={'images': {0: 'batch', 2: 'height', 3: 'width'},  # size(1,3,640,640)
+                                    'output': {0: 'batch', 2: 'y', 3: 'x'}} if dynamic else None)
+
+    # Checks
+    model_onnx = onnx.load(f)  # load onnx model
+    onnx.checker.check_model(model_onnx)  # check onnx model
+
+    # Metadata read back by models/backends.py OnnxBackend
+    for k, v in {'stride': int(max(model.stride)), 'names': model.names}.items():
+        meta = model_onnx.metadata_props.add()
+        meta.key, meta.value = k, str(v)
+    onnx.save(model_onnx, f)
+    # print(onnx.helper.printable_graph(model_onnx.graph))  # print
+
+    # Simplify
+    if simplify:
+        try:
+            check_requirements(['onnx-simplifier'])
+            import onnxsim
+
+            print(f'{prefix} simplifying with onnx-simplifier {onnxsim.__version__}...')
+            model_onnx, check = onnxsim.simplify(
+                model_onnx,
+                dynamic_input_shape=dynamic,
+                input_shapes={'images': list(img.shape)} if dynamic else None)
+            assert check, 'assert check failed'
+            onnx.save(model_onnx, f)
+        except Exception as e:
+            print(f'{prefix} simplifier failure: {e}')
+    return f
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--weights', type=str, default='./yolov5s.pt', help='weights path')
@@ -45,7 +100,6 @@ if __name__ == '__main__':
     # Load PyTorch model
     device = select_device(opt.device)
     model = attempt_load(opt.weights, map_location=device)  # load FP32 model
-    labels = model.names
 
     # Checks
     gs = int(max(model.stride))  # grid size (max stride)
@@ -60,17 +114,7 @@ if __name__ == '__main__':
         img, model = img.half(), model.half()  # to FP16
     if opt.train:
         model.train()  # training mode (no grid construction in Detect layer)
-    for k, m in model.named_modules():
-        m._non_persistent_buffers_set = set()  # pytorch 1.6.0 compatibility
-        if isinstance(m, models.common.Conv):  # assign export-friendly activations
-            if isinstance(m.act, nn.Hardswish):
-                m.act = Hardswish()
-            elif isinstance(m.act, nn.SiLU):
-                m.act = SiLU()
-        elif isinstance(m, models.yolo.Detect):
-            m.inplace = opt.inplace
-            m.onnx_dynamic = opt.dynamic
-            # m.forward = m.forward_export  # assign forward (optional)
+    prepare_export(model, inplace=opt.inplace, dynamic=opt.dynamic)
 
     for _ in range(2):
         y = model(img)  # dry runs
@@ -92,34 +136,8 @@ if __name__ == '__main__':
     if 'onnx' in opt.include:
         prefix = colorstr('ONNX:')
         try:
-            import onnx
-
-            print(f'{prefix} starting export with onnx {onnx.__version__}...')
-            f = opt.weights.replace('.pt', '.onnx')  # filename
-            torch.onnx.export(model, img, f, verbose=False, opset_version=opt.opset_version, input_names=['images'],
-                              dynamic_axes={'images': {0: 'batch', 2: 'height', 3: 'width'},  # size(1,3,640,640)
-                                            'output': {0: 'batch', 2: 'y', 3: 'x'}} if opt.dynamic else None)
-
-            # Checks
-            model_onnx = onnx.load(f)  # load onnx model
-            onnx.checker.check_model(model_onnx)  # check onnx model
-            # print(onnx.helper.printable_graph(model_onnx.graph))  # print
-
-            # Simplify
-            if opt.simplify:
-                try:
-                    check_requirements(['onnx-simplifier'])
-                    import onnxsim
-
-                    print(f'{prefix} simplifying with onnx-simplifier {onnxsim.__version__}...')
-                    model_onnx, check = onnxsim.simplify(
-                        model_onnx,
-                        dynamic_input_shape=opt.dynamic,
-                        input_shapes={'images': list(img.shape)} if opt.dynamic else None)
-                    assert check, 'assert check failed'
-                    onnx.save(model_onnx, f)
-                except Exception as e:
-                    print(f'{prefix} simplifier failure: {e}')
+            f = export_onnx(model, img, opt.weights.replace('.pt', '.onnx'), opt.opset_version, opt.dynamic,
+                            opt.simplify, prefix)
             print(f'{prefix} export success, saved as {f} ({file_size(f):.1f} MB)')
         except Exception as e:
             print(f'{prefix} export failure: {e}')
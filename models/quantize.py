@@ -0,0 +1,182 @@
+"""Quantizes a YOLOv5 *.pt model to an INT8 ONNX model for CPU inference
+
+Exports the FP32 ONNX model with models/export.py if it is missing, calibrates post-training static quantization
+on training images loaded with LoadImagesAndLabels and saves *.int8.onnx next to the weights. With --data, the
+PyTorch, FP32 ONNX and INT8 ONNX models are then compared with test.py for mAP and CPU latency.
+
+Usage:
+    $ python path/to/models/quantize.py --weights weights/Fruits.pt --data data/fruits.yaml --calib-images 200
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(Path(__file__).parent.parent.absolute().__str__())  # to run '$ python *.py' files in subdirectories
+
+import numpy as np
+import torch
+import torch.nn as nn
+import yaml
+
+from models.backends import OnnxBackend, TorchBackend
+from models.experimental import attempt_load
+from models.export import export_onnx, prepare_export
+from utils.datasets import LoadImagesAndLabels, create_dataloader
+from utils.general import colorstr, check_dataset, check_file, check_img_size, check_requirements, file_size, \
+    set_logging
+
+
+class CalibrationData:
+    # onnxruntime CalibrationDataReader over the first n images of a dataset, letterboxed to the model input size
+    def __init__(self, path, img_size=640, stride=32, n=200, input_name='images'):
+        self.dataset = LoadImagesAndLabels(path, img_size, batch_size=1, stride=stride,
+                                           prefix=colorstr('calibration: '))
+        self.n = min(n, len(self.dataset))
+        self.input_name = input_name
+        self.i = 0
+
+    def get_next(self):
+        if self.i >= self.n:
+            return None
+        img = self.dataset[self.i][0].numpy()  # uint8 RGB CHW
+        self.i += 1
+        return {self.input_name: img[None].astype(np.float32) / 255.0}
+
+    def rewind(self):
+        self.i = 0
+
+
+class BackendModel(nn.Module):
+    # Wraps a models/backends.py Backend so test.py can evaluate it like a PyTorch model
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+        self.names = backend.names
+        self.stride = torch.tensor([float(backend.stride)])
+        self.device = nn.Parameter(torch.zeros(1), requires_grad=False)  # test.py reads the device from parameters
+
+    def forward(self, x, augment=False):
+        img = (x * 255.0).round().byte().cpu().numpy()  # test.py scales to 0.0 - 1.0, backends take uint8
+        return self.backend(img), None
+
+
+def quantize(onnx_file, f, calibration, per_channel=False, method='minmax', prefix=colorstr('INT8:')):
+    # Post-training static quantization of the Conv layers of an FP32 ONNX model, returns f
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    import onnx
+
+    methods = {'minmax': CalibrationMethod.MinMax, 'entropy': CalibrationMethod.Entropy,
+               'percentile': CalibrationMethod.Percentile}
+    print(f'{prefix} calibrating on {calibration.n} images ({method})...')
+    quantize_static(onnx_file, f, calibration,
+                    quant_format=QuantFormat.QDQ,
+                    op_types_to_quantize=['Conv'],  # Detect() grid/anchor decoding stays FP32
+                    per_channel=per_channel,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                    calibrate_method=methods[method])
+
+    # Carry the stride and class names over from the FP32 model
+    model_fp32, model_int8 = onnx.load(onnx_file), onnx.load(f)
+    keys = {m.key for m in model_int8.metadata_props}
+    for m in model_fp32.metadata_props:
+        if m.key not in keys:
+            meta = model_int8.metadata_props.add()
+            meta.key, meta.value = m.key, m.value
+    onnx.save(model_int8, f)
+    return f
+
+
+def evaluate(models, data, img_size, batch_size, task='val'):
+    # Returns {name: (P, R, mAP@.5, mAP@.5:.95, ms/img)} for (name, Backend) pairs on the same letterboxed dataloader
+    import test
+
+    with open(data) as f:
+        data = yaml.safe_load(f)
+    check_dataset(data)
+    stride = max(m.stride for _, m in models)
+    opt = argparse.Namespace(single_cls=False)
+    dataloader = create_dataloader(data[task], img_size, batch_size, stride, opt, pad=0.5,
+                                   prefix=colorstr(f'{task}: '))[0]  # square images, static ONNX input size
+    results = {}
+    for name, backend in models:
+        print(f'\n{colorstr(name + ":")} evaluating...')
+        with torch.no_grad():
+            (mp, mr, map50, map, *_), _, t = test.test(data, batch_size=batch_size, imgsz=img_size,
+                                                      model=BackendModel(backend), dataloader=dataloader,
+                                                      plots=False, half_precision=False)
+        results[name] = (mp, mr, map50, map, t[0])
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='weights/Fruits.pt', help='weights path')
+    parser.add_argument('--data', type=str, default='', help='dataset.yaml path, calibrates on train, tests on val')
+    parser.add_argument('--calib-data', type=str, default='', help='calibration images, default dataset train images')
+    parser.add_argument('--calib-images', type=int, default=200, help='number of calibration images')
+    parser.add_argument('--calib-method', default='minmax', choices=('minmax', 'entropy', 'percentile'),
+                        help='activation range calibration method')
+    parser.add_argument('--per-channel', action='store_true', help='per-channel weight quantization')
+    parser.add_argument('--img-size', type=int, default=640, help='image size')
+    parser.add_argument('--opset-version', type=int, default=12, help='ONNX opset version')
+    parser.add_argument('--batch-size', type=int, default=1, help='test batch size')
+    parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime intra-op threads, 0 for default')
+    parser.add_argument('--no-test', action='store_true', help='skip the accuracy/speed report')
+    opt = parser.parse_args()
+    print(opt)
+    set_logging()
+    check_requirements(['onnx', 'onnxruntime'])
+    t = time.time()
+
+    # Load PyTorch model
+    model = attempt_load(opt.weights, map_location='cpu')  # load FP32 model
+    gs = int(max(model.stride))  # grid size (max stride)
+    opt.img_size = check_img_size(opt.img_size, gs)  # verify img_size is a gs-multiple
+
+    # FP32 ONNX model, exported with a static 1x3xSxS input like models/export.py does by default
+    onnx_file = Path(opt.weights).with_suffix('.onnx')
+    if not onnx_file.exists():
+        img = torch.zeros(1, 3, opt.img_size, opt.img_size)
+        prepare_export(model)
+        model(img)  # dry run
+        export_onnx(model, img, str(onnx_file), opt.opset_version)
+    print(f"\n{colorstr('ONNX:')} {onnx_file} ({file_size(onnx_file):.1f} MB)")
+
+    # Calibrate and quantize
+    assert opt.data or opt.calib_data, 'calibration images required, use --data or --calib-data'
+    if opt.data:
+        opt.data = check_file(opt.data)
+        with open(opt.data) as f:
+            data = yaml.safe_load(f)
+        check_dataset(data)
+    calib = opt.calib_data or data['train']
+    f = onnx_file.with_suffix('.int8.onnx')
+    calibration = CalibrationData(calib, opt.img_size, gs, opt.calib_images)
+    quantize(str(onnx_file), str(f), calibration, opt.per_channel, opt.calib_method)
+    print(f"{colorstr('INT8:')} quantization success, saved as {f} ({file_size(f):.1f} MB)")
+
+    # Accuracy vs speed report
+    if opt.data and not opt.no_test:
+        torch.set_num_threads(opt.threads or torch.get_num_threads())
+        models = [('PyTorch FP32', TorchBackend(opt.weights, 'cpu')),
+                  ('ONNX FP32', OnnxBackend(onnx_file, opt.threads)),
+                  ('ONNX INT8', OnnxBackend(f, opt.threads))]
+        results = evaluate(models, opt.data, opt.img_size, opt.batch_size)
+
+        s = ('%20s' + '%12s' * 6) % ('Model', 'Size (MB)', 'P', 'R', 'mAP@.5', 'mAP@.5:.95', 'ms/img')
+        sizes = {'PyTorch FP32': opt.weights, 'ONNX FP32': onnx_file, 'ONNX INT8': f}
+        lines = [s] + [('%20s' + '%12.1f' + '%12.3g' * 4 + '%12.1f') % (k, file_size(sizes[k]), *v)
+                       for k, v in results.items()]
+        print('\n' + '\n'.join(lines))
+        report = f.with_suffix('.json')  # i.e. Fruits.int8.json
+        with open(report, 'w') as fr:
+            json.dump({k: dict(zip(('P', 'R', 'mAP@.5', 'mAP@.5:.95', 'ms/img', 'size_mb'),
+                                   [float(x) for x in (*v, file_size(sizes[k]))])) for k, v in results.items()},
+                      fr, indent=2)
+        print(f'Report saved to {report}')
+
+    print(f'\nQuantization complete ({time.time() - t:.2f}s). Use it with --weights {f}')
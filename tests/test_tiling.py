@@ -0,0 +1,39 @@
+import numpy as np
+import torch
+
+from utils.tiling import merge_detections, tiled_predict
+
+
+def test_same_tile_overlaps_kept():
+    # Two overlapping grapes of one tile (IoU 0.16, intersection over smaller 0.7) are both kept
+    det = torch.tensor([[0, 0, 10, 10, .9, 3], [3, 0, 23, 20, .8, 3]])
+    assert len(merge_detections(det, torch.tensor([0, 0]))) == 2
+
+
+def test_seam_duplicate_merged():
+    # A fruit cut by the seam in tile 0 is suppressed by its complete box from tile 1
+    det = torch.tensor([[90, 10, 100, 30, .7, 0], [90, 10, 110, 30, .9, 0]])
+    out = merge_detections(det, torch.tensor([0, 1]))
+    assert torch.equal(out, det[1:])
+
+
+def test_full_pass():
+    # 200x100 image, tiles (0, 0, 100, 100) and (100, 0, 200, 100) plus the whole image
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    tiles = {0: torch.tensor([[10, 10, 25, 25, .8, 3],  # two grapes of a bunch
+                              [20, 10, 40, 30, .7, 3],
+                              [60, 60, 100, 99, .6, 1]]),  # left half of a fruit cut by the seam
+             100: torch.tensor([[0, 60, 60, 99, .6, 1]])}  # its right half
+    whole = torch.tensor([[10, 10, 60, 60, .95, 3],  # the whole bunch
+                          [60, 60, 160, 99, .9, 1]])  # the cut fruit
+
+    def predict(crops):
+        return [whole.clone() if crop.shape[1] == 200 else tiles[x].clone()
+                for crop, x in zip(crops, (0, 100, None))]
+
+    det = tiled_predict(predict, image, tile=100, overlap=0)
+    boxes = det[:, :4].tolist()
+    assert [10, 10, 25, 25] in boxes and [20, 10, 40, 30] in boxes  # the bunch box does not erase its grapes
+    assert [10, 10, 60, 60] not in boxes
+    assert [60, 60, 160, 99] in boxes  # the whole fruit replaces its fragments
+    assert len(boxes) == 3
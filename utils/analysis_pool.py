@@ -0,0 +1,109 @@
+"""
+Parallel fruit analysis.
+
+The per-box analyses of a frame are independent and OpenCV releases the GIL, so they can run on a thread pool.
+Headless batch runs can use a process pool instead, frames are then handed to the workers through shared memory so
+an image is copied once per frame, not pickled once per box. Results always come back in box order.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import current_process, shared_memory
+from threading import Lock
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.fruit_analysis import FruitAnalyzer, FruitQuality
+
+_analyzer = None  # FruitAnalyzer of a worker process
+
+
+def _init_worker(max_roi_pixels):
+    global _analyzer
+    _analyzer = FruitAnalyzer(max_roi_pixels)
+
+
+def _analyze_shared(name: str, shape: tuple, dtype: str, bboxes: list, fruit_types: list) -> List[FruitQuality]:
+    # Worker process: analyze boxes of a frame that lives in a shared memory block
+    shm = shared_memory.SharedMemory(name=name)
+    image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    try:
+        return [_analyzer.analyze_fruit(image, bbox, t) for bbox, t in zip(bboxes, fruit_types)]
+    finally:
+        del image  # release the buffer before closing the block
+        shm.close()
+
+
+class AnalysisPool:
+    """Thread or process pool running FruitAnalyzer.analyze_fruit() over the boxes of one or more frames."""
+
+    kinds = 'thread', 'process'
+
+    def __init__(self, workers: int = 0, kind: str = 'thread', max_roi_pixels: int = 0):
+        assert kind in self.kinds, f'unknown analysis pool {kind}, use one of {self.kinds}'
+        if kind == 'process' and current_process().daemon:  # i.e. analyze.py --workers, cannot start children
+            print('WARNING: process analysis pool unavailable in a daemon worker process, using threads')
+            kind = 'thread'
+        self.workers = workers or os.cpu_count() or 1
+        self.kind = kind
+        self.max_roi_pixels = max_roi_pixels
+        self.analyzer = FruitAnalyzer(max_roi_pixels)  # thread workers share it, processes have their own
+        self.executor = None  # created on first use
+
+    def _executor(self):
+        if self.executor is None:
+            if self.kind == 'thread':
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='analysis')
+            else:
+                self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                    initargs=(self.max_roi_pixels,))
+        return self.executor
+
+    def analyze(self, image: np.ndarray, bboxes: List[Tuple[int, int, int, int]],
+                fruit_types: List[str]) -> List[FruitQuality]:
+        """One FruitQuality per box of a frame, in box order."""
+        return self.analyze_frames([image], [bboxes], [fruit_types])[0]
+
+    def analyze_frames(self, images: List[np.ndarray], bboxes: List[list], fruit_types: List[list]) -> List[list]:
+        """FruitQualities of the boxes of several frames, one list per frame in box order."""
+        executor = self._executor()
+        if self.kind == 'thread':
+            jobs = [(image, bbox, t) for image, b, ft in zip(images, bboxes, fruit_types) for bbox, t in zip(b, ft)]
+            qualities = iter(executor.map(lambda job: self.analyzer.analyze_fruit(*job), jobs))
+            return [[next(qualities) for _ in b] for b in bboxes]
+
+        blocks, futures = [], []
+        try:
+            for image, b, ft in zip(images, bboxes, fruit_types):
+                if not len(b):
+                    futures.append([])
+                    continue
+                shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+                blocks.append(shm)
+                np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[:] = image  # the only copy of the frame
+                n = -(-len(b) // self.workers)  # boxes per task, one task per worker and frame
+                futures.append([executor.submit(_analyze_shared, shm.name, image.shape, image.dtype.str,
+                                                list(b[i:i + n]), list(ft[i:i + n])) for i in range(0, len(b), n)])
+            return [[q for f in frame for q in f.result()] for frame in futures]
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+_pools = {}  # (workers, kind, max_roi_pixels) -> AnalysisPool, shared by every detector of the process
+_pools_lock = Lock()
+
+
+def get_analysis_pool(workers: int = 0, kind: str = 'thread', max_roi_pixels: int = 0) -> AnalysisPool:
+    with _pools_lock:
+        key = (workers, kind, max_roi_pixels)
+        if key not in _pools:
+            _pools[key] = AnalysisPool(workers, kind, max_roi_pixels)
+        return _pools[key]
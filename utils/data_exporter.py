@@ -1,8 +1,10 @@
 import os
 import csv
+import time
 import pandas as pd
 from datetime import datetime
-from typing import List, Dict
+from threading import Lock
+from typing import List, Dict, Optional
 import matplotlib.pyplot as plt
 import seaborn as sns
 from .fruit_analysis import FruitQuality
@@ -172,4 +174,82 @@ class DataExporter:
         plt.savefig(filename)
         plt.close()
         
-        return filename 
\ No newline at end of file
+        return filename 
+
+
+class SessionWriter:
+    """Appends the detections of a video or live session to one CSV file as frames are analyzed.
+
+    The file is opened once and gets one row per detection, with the frame index and the time of the frame (video
+    time when fps is known, seconds since the start of the session otherwise). Rows are buffered and written every
+    flush_rows rows or flush_interval seconds, whichever comes first, so a long video costs one append per batch
+    instead of a full re-export, and at most the last batch is lost if the application dies. Call close() at the
+    end of the session.
+    """
+
+    fields = ['frame', 'time', 'camera', 'track_id', 'fruit', 'confidence', 'x1', 'y1', 'x2', 'y2', 'quality_score',
+              'ripeness_level', 'estimated_weight', 'kcal', 'defects', 'recommendations']
+
+    def __init__(self, filename: str, fps: Optional[float] = None, flush_rows: int = 256, flush_interval: float = 2.0):
+        self.filename = filename
+        self.fps = fps
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.file = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.fields)
+        self.buffer = []
+        self.frames = {}  # camera -> index of its next frame, when the caller does not pass one
+        self.rows = 0
+        self.t_start = self.t_flush = time.time()
+        self.lock = Lock()
+
+    def write(self, result: Dict, frame: Optional[int] = None, camera: int = 0):
+        """Append the detections of one analyzed frame (a FruitDetector result dict)."""
+        with self.lock:
+            if self.file is None:
+                return
+            if frame is None:
+                frame = self.frames.get(camera, 0)
+            self.frames[camera] = frame + 1
+            t = frame / self.fps if self.fps else time.time() - self.t_start
+            for a in result['analysis']:
+                q = a['quality']
+                self.buffer.append([
+                    frame, round(t, 3), camera, a.get('track_id') or '', a['name'], round(a['confidence'], 4),
+                    *a['bbox'],
+                    round(float(q.quality_score), 4),
+                    round(float(q.ripeness_level), 4),
+                    round(float(q.estimated_weight), 2),
+                    round(a['kcal'], 1) if a.get('nutritional_info') else '',
+                    ', '.join(q.defects),
+                    ', '.join(q.recommendations)])
+            if len(self.buffer) >= self.flush_rows or time.time() - self.t_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self._flush()
+
+    def _flush(self):
+        self.writer.writerows(self.buffer)
+        self.rows += len(self.buffer)
+        self.buffer = []
+        self.file.flush()
+        self.t_flush = time.time()
+
+    def close(self) -> str:
+        """Write the remaining rows and close the file, returns its path."""
+        with self.lock:
+            if self.file is not None:
+                self._flush()
+                self.file.close()
+                self.file = None
+        return self.filename
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -10,7 +10,7 @@ import time
 from itertools import repeat
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from threading import Thread
+from threading import Condition, Event, Thread
 
 import cv2
 import numpy as np
@@ -339,6 +339,148 @@ class LoadStreams:  # multiple IP or RTSP cameras
         return 0  # 1E12 frames = 32 streams at 30 FPS for 30 years
 
 
+stream_prefixes = ('rtsp://', 'rtmp://', 'http://', 'https://', 'fake:')  # live sources besides webcam indices
+
+
+def is_stream(source):
+    # True for a webcam index ('0'), a stream URL or a 'fake:<video file>' test stream
+    source = str(source).strip()
+    return source.isnumeric() or source.lower().startswith(stream_prefixes)
+
+
+def open_stream(source):
+    # Capture object of a live source, FakeStream for 'fake:<video file>'
+    source = str(source).strip()
+    if source.startswith('fake:'):
+        return FakeStream(source[5:])
+    cap = cv2.VideoCapture(int(source) if source.isnumeric() else source)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # no driver side queue of stale frames
+    return cap
+
+
+class FakeStream:  # file-backed stand-in for a live camera, for tests
+    """Plays a video file like a camera: read() blocks until the next frame is due and returns the frame of the
+    current wall-clock time, frames of a slow reader are lost. With fail_after, the stream drops after that many
+    reads (to exercise reconnects)."""
+
+    def __init__(self, path, fps=0, loop=True, fail_after=0):
+        self.cap = cv2.VideoCapture(path)
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.loop = loop
+        self.fail_after = fail_after
+        self.reads = 0
+        self.index = -1  # index of the last decoded frame
+        self.t0 = time.time()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def get(self, prop):
+        return self.fps if prop == cv2.CAP_PROP_FPS else self.cap.get(prop)
+
+    def set(self, prop, value):
+        return False
+
+    def read(self):
+        self.reads += 1
+        if self.fail_after and self.reads > self.fail_after:
+            return False, None
+        due = int((time.time() - self.t0) * self.fps)
+        if due <= self.index:  # wait for the next frame like a real camera
+            time.sleep(max((self.index + 1) / self.fps - (time.time() - self.t0), 0))
+            due = self.index + 1
+        frame = None
+        while self.index < due:  # decode up to the frame due now, the ones in between are lost
+            ok, im = self.cap.read()
+            if not ok:
+                if not self.loop or self.index < 0:
+                    return False, None
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.t0, due, self.index = time.time(), 0, -1
+                continue
+            self.index += 1
+            frame = im
+        return frame is not None, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class LatestFrame:  # one live source read on a daemon thread, only the newest frame is kept
+    def __init__(self, source, reconnect=2.0, cond=None, opener=open_stream):
+        self.source = source
+        self.reconnect = reconnect  # seconds before reopening a dropped or unavailable stream
+        self.opener = opener
+        self.cond = cond or Condition()  # notified on every new frame, may be shared by several sources
+        self.frame = None
+        self.count = 0  # frames read so far
+        self.reconnects = 0
+        self.fps = 0
+        self.stopped = Event()
+        self.thread = Thread(target=self.update, daemon=True)
+        self.thread.start()
+
+    def update(self):
+        # Read frames as fast as the source delivers them so neither OpenCV nor the network buffers any lag
+        while not self.stopped.is_set():
+            cap = self.opener(self.source)
+            if cap.isOpened():
+                self.fps = cap.get(cv2.CAP_PROP_FPS) % 100 or 30
+                while not self.stopped.is_set():
+                    ok, im = cap.read()
+                    if not ok:
+                        break
+                    with self.cond:
+                        self.frame = im
+                        self.count += 1
+                        self.cond.notify_all()
+            cap.release()
+            if not self.stopped.is_set():
+                self.reconnects += 1
+                print(f'WARNING: stream {self.source} unavailable, reconnecting in {self.reconnect:g}s')
+                self.stopped.wait(self.reconnect)
+        with self.cond:
+            self.cond.notify_all()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class LoadLatestStreams:  # several live sources, the newest frame of each
+    """Iterating yields (i, [(source index, frame), ...]) with the newest frame of every source that delivered a
+    new one since the previous iteration, so a slow consumer never sees stale frames. Sources that drop are
+    reopened in the background."""
+
+    def __init__(self, sources, reconnect=2.0, opener=open_stream):
+        self.sources = list(sources)
+        self.cond = Condition()
+        self.streams = [LatestFrame(s, reconnect, self.cond, opener) for s in self.sources]
+        self.stopped = Event()
+
+    def __iter__(self):
+        seen = [0] * len(self.streams)
+        i = 0
+        while not self.stopped.is_set():
+            with self.cond:
+                self.cond.wait_for(lambda: self.stopped.is_set() or
+                                   any(s.count > n for s, n in zip(self.streams, seen)), timeout=1.0)
+                frames = [(j, s.frame) for j, s in enumerate(self.streams) if s.count > seen[j]]
+                seen = [s.count for s in self.streams]
+            if frames and not self.stopped.is_set():
+                yield i, frames
+                i += 1
+
+    def __len__(self):
+        return len(self.sources)
+
+    def stop(self):
+        self.stopped.set()
+        for s in self.streams:
+            s.stop()
+        with self.cond:
+            self.cond.notify_all()
+
+
 def img2label_paths(img_paths):
     # Define label paths as a function of image paths
     sa, sb = os.sep + 'images' + os.sep, os.sep + 'labels' + os.sep  # /images/, /labels/ substrings
@@ -1,8 +1,48 @@
+import math
+
 import cv2
 import numpy as np
 from dataclasses import dataclass
 from typing import Dict, Tuple, List
 
+try:
+    import numba  # optional, compiles the fused color counting kernel
+except ImportError:
+    numba = None
+
+# OpenCV's fixed point division tables of the 8-bit BGR to HSV conversion (S = 255 * diff / V, H = 30 * x / diff)
+_i = np.arange(256, dtype=np.float64)
+_SDIV = np.rint((255 << 12) / np.maximum(_i, 1)) * (_i > 0)
+_HDIV = np.rint((180 << 12) / (6 * np.maximum(_i, 1))) * (_i > 0)
+_SDIV, _HDIV = _SDIV.astype(np.int64), _HDIV.astype(np.int64)
+del _i
+
+def _count_codes(roi: np.ndarray, tables: np.ndarray, sdiv: np.ndarray, hdiv: np.ndarray, hist: np.ndarray):
+    """Histogram of the range bitmasks of a BGR ROI, fused in one pass without intermediate images.
+
+    Converts every pixel to HSV exactly like cv2.cvtColor(COLOR_BGR2HSV) and looks its bitmask up in the
+    HSVRangeLUT tables. Only used compiled with numba, pure Python is far too slow.
+    """
+    for y in range(roi.shape[0]):
+        for x in range(roi.shape[1]):
+            b, g, r = np.int64(roi[y, x, 0]), np.int64(roi[y, x, 1]), np.int64(roi[y, x, 2])
+            v = max(b, g, r)
+            diff = v - min(b, g, r)
+            s = (diff * sdiv[v] + 2048) >> 12
+            if v == r:
+                h = g - b
+            elif v == g:
+                h = b - r + 2 * diff
+            else:
+                h = r - g + 4 * diff
+            h = (h * hdiv[diff] + 2048) >> 12
+            if h < 0:
+                h += 180
+            hist[tables[0, h] & tables[1, s] & tables[2, v]] += 1
+
+if numba is not None:
+    _count_codes = numba.njit(cache=True, nogil=True)(_count_codes)
+
 @dataclass
 class FruitQuality:
     ripeness_level: float  # 0-1 scale
@@ -11,8 +51,117 @@ class FruitQuality:
     recommendations: List[str]
     estimated_weight: float  # in grams
 
+class HSVRangeLUT:
+    """Lookup table mapping an HSV pixel to the bitmask of the color ranges it belongs to.
+
+    Every range is a box in HSV space, so membership separates per channel: the table holds, for each channel
+    and value, the bits of the ranges whose interval contains that value, and a pixel's bitmask is the AND of its
+    three channel lookups. This equals a full 180x256x256 table in 3x256 entries.
+    """
+    def __init__(self, ranges: List[Tuple[Tuple[int, int, int], Tuple[int, int, int]]], jit: bool = True):
+        self.jit = jit and numba is not None  # fused numba kernel for BGR ROIs, else OpenCV + NumPy
+        self.ranges = list(dict.fromkeys(ranges))
+        self.index = {r: i for i, r in enumerate(self.ranges)}  # range -> bit
+        n = len(self.ranges)
+        assert n <= 16, f'{n} color ranges, at most 16 fit a lookup table'
+        values = np.arange(256)
+        self.tables = np.zeros((3, 256), dtype=np.uint8 if n <= 8 else np.uint16)  # H, S and V tables
+        for bit, (lower, upper) in enumerate(self.ranges):
+            for c in range(3):
+                self.tables[c, (values >= lower[c]) & (values <= upper[c])] |= 1 << bit
+        self.bits = ((np.arange(1 << n)[:, None] >> np.arange(n)) & 1).astype(np.int64)  # bitmask -> ranges
+
+    def codes(self, hsv: np.ndarray) -> np.ndarray:
+        """Bitmask of the ranges containing every pixel of an HSV image."""
+        h, s, v = cv2.split(hsv)
+        codes = cv2.LUT(h, self.tables[0])
+        cv2.bitwise_and(codes, cv2.LUT(s, self.tables[1]), codes)
+        cv2.bitwise_and(codes, cv2.LUT(v, self.tables[2]), codes)
+        return codes
+
+    def histogram(self, hsv: np.ndarray) -> 'RangeCounts':
+        """Pixel count of every range over a whole HSV ROI, one table pass and one histogram of the bitmasks."""
+        n = len(self.bits)
+        if not hsv.size:  # empty box
+            return RangeCounts(self, np.zeros(len(self.ranges), dtype=np.int64), 0)
+        codes = self.codes(hsv)
+        if codes.size < 1 << 24:  # float32 histogram counts are exact
+            hist = cv2.calcHist([codes], [0], None, [n], [0, n]).ravel().astype(np.int64)
+        else:
+            hist = np.bincount(codes.ravel(), minlength=n)
+        return RangeCounts(self, hist @ self.bits, hsv.shape[0] * hsv.shape[1])
+
+    def histogram_bgr(self, roi: np.ndarray) -> 'RangeCounts':
+        """histogram() of a BGR ROI, in a single fused pass when numba is installed."""
+        if not self.jit or not roi.size:
+            return self.histogram(cv2.cvtColor(roi, cv2.COLOR_BGR2HSV) if roi.size else np.zeros((0, 0, 3), np.uint8))
+        hist = np.zeros(len(self.bits), dtype=np.int64)
+        _count_codes(roi, self.tables, _SDIV, _HDIV, hist)
+        return RangeCounts(self, hist @ self.bits, roi.shape[0] * roi.shape[1])
+
+class RangeCounts:
+    """Pixel count of every range of a HSVRangeLUT over one ROI, with the interface of ColorIntegralIndex."""
+    def __init__(self, lut: HSVRangeLUT, counts: np.ndarray, total: int):
+        self.lut, self.total, self.range_counts = lut, total, counts
+
+    def area(self, bbox: Tuple[int, int, int, int] = None) -> int:
+        return self.total
+
+    def rescale(self, total: int) -> 'RangeCounts':
+        """Counts of a downsampled ROI expressed in pixels of the full resolution ROI of total pixels."""
+        if total == self.total or not self.total:
+            return self
+        return RangeCounts(self.lut, self.range_counts * (total / self.total), total)
+
+    def counts(self, bbox: Tuple[int, int, int, int], ranges: List) -> np.ndarray:
+        return self.range_counts[[self.lut.index[tuple(map(tuple, r))] for r in ranges]]
+
+class ColorIntegralIndex:
+    """Summed-area tables of HSV color range membership for one frame.
+
+    Built once per frame, it answers "how many pixels of each range lie inside this box" in constant time,
+    whatever the size of the box.
+    """
+    def __init__(self, image: np.ndarray, ranges: List[Tuple[Tuple[int, int, int], Tuple[int, int, int]]],
+                 region: Tuple[int, int, int, int] = None, lut: HSVRangeLUT = None):
+        # Only the region covering the boxes of interest is indexed, tables are int32 per pixel and range
+        h, w = image.shape[:2]
+        self.x0, self.y0, x1, y1 = region if region is not None else (0, 0, w, h)
+        hsv = cv2.cvtColor(image[self.y0:y1, self.x0:x1], cv2.COLOR_BGR2HSV)
+        self.shape = hsv.shape[:2]
+        self.range_index = {r: i for i, r in enumerate(ranges)}
+        self.tables = np.empty((len(ranges), self.shape[0] + 1, self.shape[1] + 1), dtype=np.int32)
+        if lut is not None:  # one table pass for every range, then one bit per range
+            codes = lut.codes(hsv)
+            for table, r in zip(self.tables, ranges):
+                cv2.integral(((codes >> lut.index[r]) & 1).astype(np.uint8), table)
+            return
+        for table, (lower, upper) in zip(self.tables, ranges):
+            cv2.integral(cv2.inRange(hsv, np.array(lower), np.array(upper)) >> 7, table)  # 255 -> 1, summed in place
+
+    def _clip(self, bbox: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        h, w = self.shape
+        x1, y1, x2, y2 = bbox
+        x1, x2 = min(max(x1 - self.x0, 0), w), min(max(x2 - self.x0, 0), w)
+        y1, y2 = min(max(y1 - self.y0, 0), h), min(max(y2 - self.y0, 0), h)
+        return x1, y1, max(x1, x2), max(y1, y2)
+
+    def area(self, bbox: Tuple[int, int, int, int]) -> int:
+        """Number of pixels of the box that lie inside the indexed region."""
+        x1, y1, x2, y2 = self._clip(bbox)
+        return (x2 - x1) * (y2 - y1)
+
+    def counts(self, bbox: Tuple[int, int, int, int], ranges: List) -> np.ndarray:
+        """Pixel count of each of the given ranges inside the box."""
+        x1, y1, x2, y2 = self._clip(bbox)
+        i, t = [self.range_index[tuple(map(tuple, r))] for r in ranges], self.tables
+        return t[i, y2, x2] - t[i, y1, x2] - t[i, y2, x1] + t[i, y1, x1]
+
 class FruitAnalyzer:
-    def __init__(self):
+    def __init__(self, max_roi_pixels: int = 0):
+        # ROIs larger than this are area-downsampled before color analysis, bounding the cost per fruit (0 = off)
+        self.max_roi_pixels = max_roi_pixels
+
         # Define color ranges for different ripeness levels
         self.color_ranges = {
             'apple': {
@@ -66,19 +215,32 @@ class FruitAnalyzer:
             }
         }
 
+        # Distinct HSV ranges used by each fruit type and by the defect patterns
+        self.fruit_ranges = {fruit: [tuple(map(tuple, r)) for r in color_ranges.values()]
+                             for fruit, color_ranges in self.color_ranges.items()}
+        self.defect_ranges = [tuple(map(tuple, p['color'])) for p in self.defect_patterns.values()]
+        self.lut = HSVRangeLUT([r for ranges in self.fruit_ranges.values() for r in ranges] + self.defect_ranges)
+
     def analyze_fruit(self, image: np.ndarray, bbox: Tuple[int, int, int, int], fruit_type: str) -> FruitQuality:
         """Analyze the quality and ripeness of a fruit in the given bounding box."""
         x1, y1, x2, y2 = bbox
         fruit_roi = image[y1:y2, x1:x2]
+        area = fruit_roi.shape[0] * fruit_roi.shape[1]
+        if self.max_roi_pixels and area > self.max_roi_pixels:  # cap the cost of large fruits
+            # Average k x k pixel blocks, an integer factor keeps cv2.resize() on its fast path
+            k = math.ceil(math.sqrt(area / self.max_roi_pixels))
+            h, w = fruit_roi.shape[0] // k, fruit_roi.shape[1] // k
+            if h and w:
+                fruit_roi = cv2.resize(fruit_roi[:h * k, :w * k], (w, h), interpolation=cv2.INTER_AREA)
         
-        # Convert to HSV for better color analysis
-        hsv = cv2.cvtColor(fruit_roi, cv2.COLOR_BGR2HSV)
+        # Count every HSV color range in one pass over the ROI
+        counts = self.lut.histogram_bgr(fruit_roi).rescale(area)  # in full resolution pixels
         
         # Analyze ripeness
-        ripeness = self._analyze_ripeness(hsv, fruit_type)
+        ripeness = self._analyze_ripeness(None, fruit_type, counts)
         
         # Detect defects
-        defects = self._detect_defects(hsv, fruit_roi.shape[0] * fruit_roi.shape[1])
+        defects = self._detect_defects(None, area, counts)
         
         # Calculate quality score
         quality_score = self._calculate_quality_score(ripeness, defects)
@@ -97,19 +259,56 @@ class FruitAnalyzer:
             estimated_weight=estimated_weight
         )
 
-    def _analyze_ripeness(self, hsv: np.ndarray, fruit_type: str) -> float:
-        """Analyze the ripeness level based on color."""
+    def analyze_fruits(self, image: np.ndarray, bboxes: List[Tuple[int, int, int, int]],
+                       fruit_types: List[str]) -> List[FruitQuality]:
+        """Analyze all fruits of a frame at once, returning one FruitQuality per bounding box.
+
+        The frame region covering the boxes is converted to HSV once and indexed with one integral image per
+        color range, so each box is scored in constant time. With max_roi_pixels, boxes above the cap are analyzed
+        on their own downsampled ROI instead and left out of the region.
+        """
+        if not len(bboxes):
+            return []
+        if self.max_roi_pixels:
+            large = [(x2 - x1) * (y2 - y1) > self.max_roi_pixels for x1, y1, x2, y2 in bboxes]
+            if any(large):
+                small = iter(self.analyze_fruits(image, [b for b, l in zip(bboxes, large) if not l],
+                                                 [t for t, l in zip(fruit_types, large) if not l]))
+                return [self.analyze_fruit(image, b, t) if l else next(small)
+                        for b, t, l in zip(bboxes, fruit_types, large)]
+        h, w = image.shape[:2]
+        region = (max(min(b[0] for b in bboxes), 0), max(min(b[1] for b in bboxes), 0),
+                  min(max(b[2] for b in bboxes), w), min(max(b[3] for b in bboxes), h))
+        ranges = [r for fruit in dict.fromkeys(t.lower() for t in fruit_types) for r in self.fruit_ranges.get(fruit, [])]
+        ranges = list(dict.fromkeys(ranges + self.defect_ranges))  # unique ranges needed for this frame
+        index = ColorIntegralIndex(image, ranges, region, self.lut)
+
+        qualities = []
+        for bbox, fruit_type in zip(bboxes, fruit_types):
+            ripeness = self._analyze_ripeness(None, fruit_type, index, bbox)
+            defects = self._detect_defects(None, index.area(bbox), index, bbox)
+            qualities.append(FruitQuality(
+                ripeness_level=ripeness,
+                quality_score=self._calculate_quality_score(ripeness, defects),
+                defects=defects,
+                recommendations=self._generate_recommendations(ripeness, defects, fruit_type),
+                estimated_weight=self.estimate_weight(bbox, fruit_type)
+            ))
+        return qualities
+
+    def _analyze_ripeness(self, hsv: np.ndarray, fruit_type: str, index: ColorIntegralIndex = None,
+                          bbox: Tuple[int, int, int, int] = None) -> float:
+        """Analyze the ripeness level based on color, from the HSV ROI or from a frame index and bbox."""
         if fruit_type.lower() not in self.color_ranges:
             return 0.5  # Default middle value if fruit type not known
-            
-        color_ranges = self.color_ranges[fruit_type.lower()]
-        ripeness_scores = []
-        
-        for color, (lower, upper) in color_ranges.items():
-            mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
-            percentage = np.sum(mask > 0) / (mask.shape[0] * mask.shape[1])
-            ripeness_scores.append(percentage)
-            
+
+        if index is None:
+            index = self.lut.histogram(hsv)
+        counts = index.counts(bbox, self.fruit_ranges[fruit_type.lower()])
+        return self._weighted_ripeness(list(counts / max(index.area(bbox), 1)), fruit_type)
+
+    def _weighted_ripeness(self, ripeness_scores: List[float], fruit_type: str) -> float:
+        """Combine the per-color area fractions into a ripeness level."""
         # Weight the scores based on color importance
         if fruit_type.lower() == 'banana':
             weights = [0.2, 0.6, 0.2]  # green, yellow, brown
@@ -126,14 +325,19 @@ class FruitAnalyzer:
             
         return np.average(ripeness_scores, weights=weights)
 
-    def _detect_defects(self, hsv: np.ndarray, total_area: int) -> List[str]:
-        """Detect defects in the fruit."""
+    def _detect_defects(self, hsv: np.ndarray, total_area: int, index: ColorIntegralIndex = None,
+                        bbox: Tuple[int, int, int, int] = None) -> List[str]:
+        """Detect defects in the fruit, from the HSV ROI or from a frame index and bbox."""
+        if index is None:
+            index = self.lut.histogram(hsv)
+        return self._defects_from_areas(list(index.counts(bbox, self.defect_ranges)), total_area)
+
+    def _defects_from_areas(self, areas: List[int], total_area: int) -> List[str]:
+        """Turn the pixel area of each defect pattern into the list of detected defects."""
         defects = []
         
-        for defect_type, pattern in self.defect_patterns.items():
-            mask = cv2.inRange(hsv, np.array(pattern['color'][0]), np.array(pattern['color'][1]))
-            defect_area = np.sum(mask > 0)
-            defect_percentage = defect_area / total_area
+        for (defect_type, pattern), defect_area in zip(self.defect_patterns.items(), areas):
+            defect_percentage = defect_area / max(total_area, 1)
             
             if defect_area > pattern['min_area'] and defect_percentage > pattern['threshold']:
                 defects.append(defect_type)
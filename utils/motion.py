@@ -0,0 +1,48 @@
+"""
+Motion gate for fixed cameras.
+
+Compares a small blurred grayscale thumbnail of every frame with the thumbnail of the last frame that went
+through the model, so static scenes can reuse the last detections instead of running inference again.
+"""
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Decides per frame whether the scene changed enough to run the detector again.
+
+    A frame is considered changed when more than `threshold` of the thumbnail pixels differ by more than
+    `pixel_thres` gray levels from the last inferred frame. Every `refresh` frames inference runs anyway.
+    """
+
+    def __init__(self, threshold: float = 0.002, pixel_thres: int = 25, size: int = 64, refresh: int = 30):
+        self.threshold = threshold  # fraction of changed thumbnail pixels
+        self.pixel_thres = pixel_thres  # gray level difference of a changed pixel
+        self.size = size  # thumbnail width
+        self.refresh = refresh  # max frames between two inferences, 0 to never force one
+        self.reference = None  # thumbnail of the last inferred frame
+        self.since = 0  # frames since the last inference
+        self.last = None  # detections of the last inferred frame
+        self.skipped = 0  # frames that reused detections
+
+    def reset(self):
+        self.reference, self.since, self.last, self.skipped = None, 0, None, 0
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        thumb = cv2.resize(gray, (self.size, max(round(self.size * h / w), 1)), interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(thumb, (3, 3), 0)  # ignore sensor noise
+
+    def changed(self, frame: np.ndarray) -> bool:
+        """True if the frame must go through the model, it then becomes the new reference."""
+        thumb = self.thumbnail(frame)
+        self.since += 1
+        if self.reference is None or self.reference.shape != thumb.shape or \
+                (self.refresh and self.since >= self.refresh) or \
+                (cv2.absdiff(thumb, self.reference) > self.pixel_thres).mean() > self.threshold:
+            self.reference, self.since = thumb, 0
+            return True
+        self.skipped += 1
+        return False
@@ -3,6 +3,11 @@ Nutritional information for different fruits.
 All values are per 100g of edible portion.
 """
 
+from functools import lru_cache
+from typing import Dict, Union
+
+import numpy as np
+
 FRUIT_NUTRITION = {
     'apple': {
         'calories': 52,
@@ -262,4 +267,56 @@ def format_nutritional_info(fruit_name, info):
     formatted += f"<b>Vitamins:</b> {', '.join(info['vitamins'])}<br>"
     formatted += f"<b>Minerals:</b> {', '.join(info['minerals'])}<br>"
     formatted += f"<b>Benefits:</b> {info['benefits']}"
-    return formatted 
\ No newline at end of file
+    return formatted 
+
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fiber')  # numeric columns of NutritionTable, kcal and grams
+
+
+def nutrient_value(value) -> float:
+    """Numeric value of a FRUIT_NUTRITION quantity, i.e. 52 or '0.3g'."""
+    return float(str(value).rstrip('g'))
+
+
+class NutritionTable:
+    """FRUIT_NUTRITION compiled for the class list of a model.
+
+    Row c of values holds the numeric NUTRIENTS per 100g of class c (zeros for classes without nutritional
+    information), so the totals of a frame are one gather and one product over the detected class ids instead of a
+    dict lookup and string parsing per detection. info[c] is the FRUIT_NUTRITION entry of class c or None.
+    """
+
+    def __init__(self, names: Union[list, dict]):
+        names = dict(names) if isinstance(names, dict) else dict(enumerate(names))
+        n = max(names) + 1 if names else 0
+        self.info = [None] * n
+        self.values = np.zeros((n, len(NUTRIENTS)), dtype=np.float32)
+        for c, name in names.items():
+            info = get_nutritional_info(name)
+            if info:
+                self.info[c] = info
+                self.values[c] = [nutrient_value(info[k]) for k in NUTRIENTS]
+        self.known = self.values.any(1)  # classes with nutritional information
+
+    def __len__(self):
+        return len(self.info)
+
+    def per_fruit(self, classes, grams) -> np.ndarray:
+        """(n, len(NUTRIENTS)) nutrients of n fruits of the given class ids and estimated weights (g)."""
+        classes = np.asarray(classes, dtype=np.int64).reshape(-1)
+        grams = np.asarray(grams, dtype=np.float32).reshape(-1)
+        return self.values[classes] * (grams[:, None] / 100)
+
+    def totals(self, classes, grams) -> Dict[str, float]:
+        """Summed nutrients of fruits of the given class ids and estimated weights (g), by NUTRIENTS name."""
+        return dict(zip(NUTRIENTS, self.per_fruit(classes, grams).sum(0, dtype=np.float64).tolist()))
+
+
+@lru_cache(maxsize=8)
+def _nutrition_table(names: tuple) -> NutritionTable:
+    return NutritionTable(dict(names))
+
+
+def get_nutrition_table(names: Union[list, dict]) -> NutritionTable:
+    """NutritionTable of a model's class names, shared by every detector of the process using the same classes."""
+    return _nutrition_table(tuple(names.items() if isinstance(names, dict) else enumerate(names)))
@@ -0,0 +1,131 @@
+"""
+Incremental HTML for the GUI text panels.
+
+Panels receive a small hashable state per frame and only rebuild their HTML when that state changed since the last
+render, at most once per UI refresh. The HTML of every fruit is built from memoized blocks, so a frame showing the
+same fruits as the previous one costs a tuple comparison instead of a full re-layout of the widget.
+"""
+
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+from utils.nutritional_info import format_nutritional_info, get_nutritional_info
+
+
+@lru_cache(maxsize=256)
+def nutrition_block(fruit: str, count: int) -> str:
+    info = get_nutritional_info(fruit)
+    if info:
+        return f"<b>{fruit} (x{count})</b><br>" + format_nutritional_info(fruit, info) + "<br><br>"
+    return f"<b>{fruit} (x{count})</b>: No nutritional information available.<br><br>"
+
+
+@lru_cache(maxsize=4096)
+def analysis_block(name: str, confidence: str, score: str, ripeness: str, weight: str, defects: Tuple[str, ...],
+                   recommendations: Tuple[str, ...], nutrition: bool) -> str:
+    # Arguments are the already formatted values shown in the panel, confidence is None in the quality panel
+    text = f"<b>{name}</b><br>"
+    if confidence is not None:
+        text += f"Confidence: {confidence}<br>"
+    text += f"Quality Score: {score}<br>"
+    text += f"Ripeness Level: {ripeness}<br>"
+    text += f"Estimated Weight: {weight}g<br>"
+
+    if defects:
+        text += "Defects Detected:<br>"
+        for defect in defects:
+            text += f"- {defect}<br>"
+
+    if recommendations:
+        text += "Recommendations:<br>"
+        for rec in recommendations:
+            text += f"- {rec}<br>"
+
+    nutr = get_nutritional_info(name) if nutrition else None
+    if nutr:
+        text += "<br>Nutritional Information:<br>"
+        text += f"Calories: {nutr['calories']} kcal<br>"
+        text += f"Protein: {nutr['protein']}g<br>"
+        text += f"Carbs: {nutr['carbs']}g<br>"
+        text += f"Fiber: {nutr['fiber']}g<br>"
+        text += f"Vitamins: {', '.join(nutr['vitamins'])}<br>"
+    return text + "<br>"
+
+
+def analysis_key(analysis: dict, confidence: bool = True, nutrition: bool = True) -> tuple:
+    """analysis_block() arguments of one fruit analysis, equal keys render identical HTML."""
+    q = analysis['quality']
+    return (analysis['name'],
+            f"{analysis['confidence']:.2f}" if confidence else None,
+            f"{q.quality_score:.2f}",
+            f"{q.ripeness_level:.2f}",
+            f"{q.estimated_weight:.1f}",
+            tuple(q.defects),
+            tuple(q.recommendations),
+            nutrition and bool(analysis['nutritional_info']))
+
+
+def nutrition_state(history: Dict[str, int]) -> tuple:
+    return tuple(history.items())
+
+
+def render_nutrition(state: tuple) -> str:
+    if not state:
+        return "No fruits detected."
+    return "<h3>Detected Fruits:</h3>" + ''.join(nutrition_block(fruit, count) for fruit, count in state)
+
+
+def analysis_state(analysis_list: List[dict]) -> tuple:
+    return 'analysis', tuple(analysis_key(a) for a in analysis_list) if analysis_list else None
+
+
+def quality_state(qualities: list, analysis_list: List[dict]) -> tuple:
+    if not qualities:
+        return 'quality', None
+    return 'quality', tuple(analysis_key(a, confidence=False, nutrition=False) for a in analysis_list or ())
+
+
+def render_analysis(state: tuple) -> str:
+    kind, keys = state
+    if keys is None:
+        return "No analysis available." if kind == 'analysis' else "No quality analysis available."
+    if kind == 'analysis':
+        return "<h3>Fruit Analysis:</h3>" + ''.join(analysis_block(*k) for k in keys)
+    if not keys:
+        return "<h3>Quality Analysis:</h3>No fruit analysis available."
+    return "<h3>Quality Analysis:</h3>" + ''.join(analysis_block(*k) for k in keys)
+
+
+class Panel:
+    """Coalesces the updates of one QTextEdit.
+
+    update() only records the latest state and its render function, flush() (called by a UI timer) renders it if
+    it differs from the last rendered state and calls setHtml() only if the resulting HTML changed.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.state = self.rendered = None
+        self.render: Callable[[tuple], str] = None
+        self.html = None
+        self.renders = self.updates = 0
+
+    def update(self, state: tuple, render: Callable[[tuple], str]):
+        self.state, self.render = state, render
+        self.updates += 1
+
+    def flush(self) -> bool:
+        if self.render is None or self.state == self.rendered:
+            return False
+        html = self.render(self.state)
+        self.rendered = self.state
+        if html == self.html:
+            return False
+        self.widget.setHtml(html)
+        self.html = html
+        self.renders += 1
+        return True
+
+    def clear(self):
+        self.state = self.rendered = self.render = self.html = None
+        self.widget.clear()
@@ -0,0 +1,302 @@
+"""
+Threaded streaming pipeline for video processing.
+
+Frames flow from a decoder thread through a chain of stages (each on its own thread) connected by bounded
+queues, so decoding, inference and annotation overlap instead of running one after the other.
+"""
+
+import time
+from dataclasses import dataclass
+from queue import Queue, Empty, Full
+from threading import Thread, Event, Lock
+from typing import Callable, Iterable, List, Optional
+
+END = object()  # end of stream marker passed down the queues
+
+
+@dataclass
+class StageStats:
+    name: str
+    depth: int = 0          # items waiting in the stage's input queue
+    latency: float = 0.0    # moving average processing time per item (ms)
+    processed: int = 0      # items processed so far
+    dropped: int = 0        # items dropped from the input queue (live sources only)
+
+
+class BoundedQueue(Queue):
+    """Queue with a maximum size that either blocks or drops its oldest item when full."""
+
+    def __init__(self, maxsize: int, drop_oldest: bool = False):
+        super().__init__(maxsize)
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        self.closed = False  # consumer is gone, producers stop feeding it
+
+    def put(self, item, block=True, timeout=None):
+        if not self.drop_oldest:
+            return super().put(item, block, timeout)
+        while True:
+            try:
+                return super().put(item, block=False)
+            except Full:
+                try:
+                    self.get_nowait()  # make room by discarding the oldest frame
+                    self.dropped += 1
+                except Empty:
+                    pass
+
+
+class Stage:
+    """A processing step run on its own thread.
+
+    fn receives a list of up to batch_size items and returns a list of output items. A partial batch is
+    processed once max_wait seconds have passed since its first item arrived. Stages that hold items back (i.e. until
+    a later item arrives) can return them from flush() once the stream ends.
+    """
+
+    def __init__(self, name: str, fn: Callable[[list], list], batch_size: int = 1, max_wait: float = 0.0,
+                 flush: Optional[Callable[[], list]] = None):
+        self.name = name
+        self.fn = fn
+        self.flush = flush
+        self.batch_size = max(batch_size, 1)
+        self.max_wait = max_wait
+        self.stats = StageStats(name)
+
+
+class Pipeline:
+    """Decoder thread + stages connected by bounded queues. Iterate over it to get the final outputs in order."""
+
+    def __init__(self, source: Iterable, stages: List[Stage], maxsize: int = 8, drop_oldest: bool = False):
+        self.source = source
+        self.stages = stages
+        self.decoder = StageStats('decode')
+        self.queues = [BoundedQueue(maxsize, drop_oldest)]  # only the decoder output may drop frames
+        self.queues += [BoundedQueue(maxsize) for _ in stages]
+        self.stopped = Event()
+        self.error: Optional[BaseException] = None
+        self.lock = Lock()
+        self.threads = [Thread(target=self._decode, daemon=True)]
+        self.threads += [Thread(target=self._work, args=(i,), daemon=True) for i in range(len(stages))]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def __iter__(self):
+        out, ended = self.queues[-1], False
+        try:
+            while True:
+                item = out.get()
+                if item is END:
+                    ended = True
+                    break
+                yield item
+        finally:
+            if not ended:  # consumer left early, release the threads blocked on full queues
+                self.stop()
+        if self.error is not None:
+            raise self.error
+
+    def stats(self) -> List[StageStats]:
+        """Current queue depth and latency of every stage, decoder first."""
+        self.decoder.depth = 0
+        self.decoder.dropped = self.queues[0].dropped
+        for stage, q in zip(self.stages, self.queues):
+            stage.stats.depth = q.qsize()
+        return [self.decoder] + [s.stats for s in self.stages]
+
+    def _update(self, stats: StageStats, seconds: float, n: int):
+        ms = 1000 * seconds / max(n, 1)
+        with self.lock:
+            stats.latency = ms if not stats.processed else 0.9 * stats.latency + 0.1 * ms  # EMA
+            stats.processed += n
+
+    def _put(self, q, item) -> bool:
+        # Blocks while q is full but gives up once the pipeline is stopped, so a failed stage or a consumer that
+        # left cannot block its producers forever
+        while not self.stopped.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _end(self, q):
+        # The end marker always gets through, a stopped pipeline drops queued items to make room for it
+        while True:
+            try:
+                return q.put(END, timeout=0.1)
+            except Full:
+                if self.stopped.is_set():
+                    try:
+                        q.get_nowait()
+                    except Empty:
+                        pass
+
+    def _decode(self):
+        q, it = self.queues[0], None
+        try:
+            it = iter(self.source)
+            while not self.stopped.is_set():
+                t = time.time()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                self._update(self.decoder, time.time() - t, 1)
+                self._put(q, item)
+        except Exception as e:
+            self.error = e
+            self.stopped.set()
+        finally:
+            if hasattr(it, 'close'):  # i.e. a FanOut subscription, unsubscribes so the reader does not block
+                it.close()
+            self._end(q)
+
+    def _work(self, i: int):
+        stage, q_in, q_out = self.stages[i], self.queues[i], self.queues[i + 1]
+        end = False
+        while not end:
+            item = q_in.get()
+            if item is END:
+                end = True
+                break
+            items, deadline = [item], time.time() + stage.max_wait
+            while len(items) < stage.batch_size:
+                try:
+                    item = q_in.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    break
+                if item is END:
+                    end = True
+                    break
+                items.append(item)
+
+            if self.stopped.is_set():  # discard the remaining items
+                continue
+            t = time.time()
+            try:
+                outputs = stage.fn(items)
+            except Exception as e:
+                self.error = e
+                self.stopped.set()
+                break
+            self._update(stage.stats, time.time() - t, len(items))
+            for output in outputs:
+                self._put(q_out, output)
+        if not end:  # failed, keep reading so upstream stages and the decoder reach their end marker
+            while q_in.get() is not END:
+                pass
+        elif stage.flush is not None and self.error is None:
+            for output in stage.flush():
+                self._put(q_out, output)
+        self._end(q_out)
+
+
+class FanOut:
+    """Reads a source once on its own thread and hands every item to several consumers.
+
+    subscribe() consumers get an iterable over a bounded queue that blocks the reader when full (or drops its
+    oldest items with drop_oldest), listen() consumers get a callback on the reader thread for every n-th item.
+    """
+
+    def __init__(self, source: Iterable):
+        self.source = source
+        self.queues: List[BoundedQueue] = []
+        self.listeners = []  # (callback, every)
+        self.stopped = Event()
+        self.error: Optional[BaseException] = None
+        self.thread = Thread(target=self._read, daemon=True)
+
+    def subscribe(self, maxsize: int = 8, drop_oldest: bool = False) -> Iterable:
+        q = BoundedQueue(maxsize, drop_oldest)
+        self.queues.append(q)
+        return self._iterate(q)
+
+    def listen(self, fn: Callable, every: int = 1):
+        self.listeners.append((fn, max(every, 1)))
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _iterate(self, q):
+        ended = False
+        try:
+            while True:
+                item = q.get()
+                if item is END:
+                    ended = True
+                    break
+                yield item
+        finally:
+            if not ended:  # consumer closed the iterator early, stop feeding it
+                q.closed = True
+                if all(x.closed for x in self.queues):
+                    self.stopped.set()
+        if self.error is not None:
+            raise self.error
+
+    def _put(self, q, item):
+        while not self.stopped.is_set() and not q.closed:  # a stopped consumer must not block the reader forever
+            try:
+                return q.put(item, timeout=0.1)
+            except Full:
+                pass
+
+    def _read(self):
+        try:
+            for i, item in enumerate(self.source):
+                if self.stopped.is_set():
+                    break
+                for fn, every in self.listeners:
+                    if i % every == 0:
+                        fn(item)
+                for q in self.queues:
+                    if not q.closed:
+                        self._put(q, item)
+        except Exception as e:
+            self.error = e
+        finally:
+            for q in self.queues:
+                while True:
+                    try:
+                        q.put(END, timeout=0.1)
+                        break
+                    except Full:
+                        if self.stopped.is_set() or q.closed:  # consumer gone, make room for the end marker
+                            try:
+                                q.get_nowait()
+                            except Empty:
+                                pass
+
+
+def video_frames(cap) -> Iterable:
+    """Yield (frame index, frame) from an opened cv2.VideoCapture until the stream ends."""
+    i = 0
+    while True:
+        valid, frame = cap.read()
+        if valid is not True:
+            break
+        yield i, frame
+        i += 1
+
+
+def format_stats(stats: List[StageStats]) -> str:
+    """One-line summary of the pipeline state, i.e. for a status bar."""
+    s = []
+    for st in stats:
+        x = f'{st.name}: q{st.depth} {st.latency:.1f}ms'
+        if st.dropped:
+            x += f' ({st.dropped} dropped)'
+        s.append(x)
+    return ' | '.join(s)
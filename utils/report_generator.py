@@ -5,7 +5,11 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from datetime import datetime
 import os
-from typing import List, Dict
+import time
+from collections import OrderedDict
+from queue import Full, Queue
+from threading import Lock, Thread
+from typing import List, Dict, Optional, Callable
 import cv2
 import numpy as np
 from .fruit_analysis import FruitQuality
@@ -138,4 +142,148 @@ class ReportGenerator:
         # Clean up temporary image file
         os.remove(img_path)
         
-        return report_path
\ No newline at end of file
+        return report_path
+
+
+_reports = OrderedDict()  # frame key -> report path of frames already reported, shared by every ReportWorker
+_reports_lock = Lock()
+
+
+class ReportWorker:
+    """Generate PDF reports on a background thread so detection never waits on ReportLab.
+
+    The thread is started by the first queued report and ended by close(), a later report starts it again. At most
+    max_queued reports wait for the thread, while they are all taken only the newest frame waits for room (older
+    waiting frames are skipped), so a busy worker never piles up frames.
+
+    Policies:
+        'frame':    one report for every submitted frame
+        'video':    one report with the last submitted frame when flush() is called
+        'interval': at most one report every `interval` seconds, plus the last frame on flush()
+        'manual':   only when request() is called
+    """
+    policies = ('frame', 'video', 'interval', 'manual')
+
+    def __init__(self, policy: str = 'video', interval: float = 10.0,
+                 callback: Optional[Callable[[str], None]] = None, max_queued: int = 2):
+        assert policy in self.policies, f'Unknown report policy {policy}, use one of {self.policies}'
+        self.policy = policy
+        self.interval = interval
+        self.callback = callback  # called with the report path from the worker thread
+        self.generator = ReportGenerator()
+        self.max_queued = max_queued
+        self.queue = Queue(max_queued)
+        self.overflow = None  # newest job that did not fit in the queue
+        self.skipped = 0  # jobs replaced by a newer overflow job
+        self.lock = Lock()
+        self.latest = None  # last submitted (image, detections, qualities, nutritional_info)
+        self.pending = False  # latest has not been reported yet
+        self.last_report = 0.0
+        self.thread = None
+
+    def submit(self, image, detections, qualities, nutritional_info, key=None):
+        """Hand over the results of a frame, reporting them now or later depending on the policy.
+
+        Frames with a key (see utils/result_cache.py) that was already reported are not reported again.
+        """
+        job = (image, detections, qualities, nutritional_info, key)
+        with self.lock:
+            path = self._reported(key)
+            if path is not None:
+                self.latest, self.pending = job, False
+                if self.callback:
+                    self.callback(path)
+                return
+            self.latest, self.pending = job, True
+            now = time.time()
+            if self.policy == 'frame' or (self.policy == 'interval' and now - self.last_report >= self.interval):
+                self.last_report, self.pending = now, False
+                self._put(job)
+
+    def flush(self):
+        """End of a video or image: report the last frame if the policy asks for it."""
+        with self.lock:
+            if self.policy in ('video', 'interval') and self.pending:
+                self.pending = False
+                self._put(self.latest)
+
+    def request(self) -> bool:
+        """Report the last submitted frame on demand. Returns False if nothing was submitted yet."""
+        with self.lock:
+            if self.latest is None:
+                return False
+            self.pending = False
+            path = self._reported(self.latest[-1])
+            if path is not None:
+                if self.callback:
+                    self.callback(path)
+                return True
+            self._put(self.latest)
+        return True
+
+    def join(self):
+        """Block until all queued reports are written."""
+        self.queue.join()
+
+    def close(self):
+        """Write the queued reports and end the worker thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+            queue, overflow, self.overflow = self.queue, self.overflow, None
+        if thread is not None:
+            if overflow is not None:
+                queue.put(overflow)
+            queue.put(None)  # end of the thread
+            thread.join()
+        if self.skipped:
+            print(f'{self.skipped} reports skipped while the report worker was busy')
+            self.skipped = 0
+
+    @staticmethod
+    def _reported(key):
+        # Path of the report of an already reported frame, or None
+        if key is None:
+            return None
+        with _reports_lock:
+            return _reports.get(key)
+
+    def _put(self, job):
+        # Queue a report, starting the worker thread if needed. Called with self.lock held
+        if self.thread is None:
+            self.queue = Queue(self.max_queued)  # a closing thread keeps its own queue
+            self.thread = Thread(target=self._run, args=(self.queue,), daemon=True)
+            self.thread.start()
+        try:
+            self.queue.put_nowait(job)
+        except Full:  # worker busy, the newest job waits for room
+            if self.overflow is not None:
+                self.skipped += 1
+            self.overflow = job
+
+    def _run(self, queue):
+        while True:
+            job = queue.get()
+            if job is None:
+                queue.task_done()
+                break
+            *job, key = job
+            try:
+                report_path = self.generator.generate_report(*job)
+                if key is not None:
+                    with _reports_lock:
+                        _reports[key] = report_path
+                        if len(_reports) > 1000:
+                            _reports.popitem(last=False)
+                if self.callback:
+                    self.callback(report_path)
+            except Exception as e:
+                print(f'Report generation failure: {e}')
+            finally:
+                with self.lock:
+                    if self.overflow is not None and queue is self.queue:
+                        try:
+                            queue.put_nowait(self.overflow)
+                            self.overflow = None
+                        except Full:
+                            pass
+                queue.task_done()
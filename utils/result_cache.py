@@ -0,0 +1,157 @@
+"""
+Frame result cache.
+
+Detection and analysis results are stored under a fast hash of the frame content combined with the model and
+threshold settings, in a size bounded in-memory LRU and optionally on disk, so re-submitted images are answered
+without running the model again.
+"""
+
+import hashlib
+import os
+import pickle
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+import numpy as np
+
+try:
+    import xxhash  # faster content hashing
+except ImportError:
+    xxhash = None
+
+
+def content_hash(img: np.ndarray, salt: str = '') -> str:
+    """Hex digest of an image's pixels, shape and dtype, combined with salt (i.e. the model settings)."""
+    h = xxhash.xxh3_128() if xxhash else hashlib.blake2b(digest_size=16)
+    h.update(f'{salt}|{img.shape}|{img.dtype}'.encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of per-frame results with an optional on-disk second level.
+
+    The memory level holds at most max_items results. The disk level (one pickle per key in cache_dir) is trimmed
+    to max_disk_mb by deleting the least recently used files. Its size is tracked in memory and the directory is
+    only rescanned when over budget or every rescan_every writes, so processes sharing cache_dir see each other's
+    files without a scan per write.
+    """
+
+    def __init__(self, max_items: int = 128, cache_dir: str = '', max_disk_mb: float = 512, rescan_every: int = 100):
+        self.max_items = max_items
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_disk_bytes = max_disk_mb * 1E6
+        self.items = OrderedDict()
+        self.lock = Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self.rescan_every = rescan_every
+        self.disk = {}  # cache file -> size in bytes
+        self.disk_bytes = self.puts = 0
+        self.disk_lock = Lock()
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._scan()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+        value = self._load(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Any):
+        with self.lock:
+            self._remember(key, value)
+        if self.cache_dir:
+            self._save(key, value)
+
+    def stats(self) -> str:
+        n = self.hits + self.disk_hits + self.misses
+        return f'cache: {self.hits} hits, {self.disk_hits} disk hits, {self.misses} misses ' \
+               f'({100 * (self.hits + self.disk_hits) / max(n, 1):.0f}% hit rate)'
+
+    def _remember(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)  # least recently used
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        f = self.cache_dir / f'{key}.pkl'
+        try:
+            with open(f, 'rb') as fi:
+                value = pickle.load(fi)
+            os.utime(f)  # mark as recently used
+            return value
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def _save(self, key, value):
+        f = self.cache_dir / f'{key}.pkl'
+        tmp = f.with_name(f'{key}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')  # unique per writer
+        try:
+            with open(tmp, 'wb') as fo:
+                pickle.dump(value, fo, protocol=pickle.HIGHEST_PROTOCOL)
+                size = fo.tell()
+            os.replace(tmp, f)  # atomic, readers never see partial files
+        except OSError as e:
+            print(f'WARNING: result cache write failure: {e}')
+            tmp.unlink(missing_ok=True)
+            return
+        with self.disk_lock:
+            self.disk_bytes += size - self.disk.get(f, 0)
+            self.disk[f] = size
+            self.puts += 1
+            if self.disk_bytes > self.max_disk_bytes or self.puts >= self.rescan_every:
+                files = self._scan()
+                for _, size, x in files:  # evict the least recently used files, always keep the new one
+                    if self.disk_bytes <= self.max_disk_bytes:
+                        break
+                    if x == f:
+                        continue
+                    try:
+                        x.unlink()
+                    except FileNotFoundError:  # already evicted by another process
+                        pass
+                    self.disk_bytes -= size
+                    self.disk.pop(x, None)
+
+    def _scan(self):
+        # Index the files of the cache directory, including those written by other processes. Returns them as
+        # (mtime, size, path) tuples, least recently used first
+        files = []
+        for x in self.cache_dir.glob('*.pkl'):
+            try:
+                st = x.stat()
+            except FileNotFoundError:  # evicted by another process meanwhile
+                continue
+            files.append((st.st_mtime, st.st_size, x))
+        files.sort(key=lambda t: t[0])
+        self.disk = {x: size for _, size, x in files}
+        self.disk_bytes = sum(self.disk.values())
+        self.puts = 0
+        return files
+
+_caches = {}  # (max_items, cache_dir, max_disk_mb) -> ResultCache, shared by every detector of the process
+_caches_lock = Lock()
+
+
+def get_cache(max_items: int = 128, cache_dir: str = '', max_disk_mb: float = 512) -> ResultCache:
+    with _caches_lock:
+        key = (max_items, str(cache_dir), max_disk_mb)
+        if key not in _caches:
+            _caches[key] = ResultCache(max_items, cache_dir, max_disk_mb)
+        return _caches[key]
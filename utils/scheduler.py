@@ -0,0 +1,137 @@
+"""
+Adaptive frame scheduling for real-time video playback.
+
+When detecting and analyzing a frame takes longer than the frame interval, only every n-th frame goes through the
+detector, n following the measured per-frame cost. The results of the frames in between are interpolated from
+the neighbouring processed frames, so playback keeps the video's own speed with moving boxes.
+"""
+
+import math
+from threading import Lock
+from typing import List, Optional
+
+import numpy as np
+import torch
+from scipy.optimize import linear_sum_assignment
+
+from utils.tracker import iou_matrix
+
+
+class FrameScheduler:
+    """Decides which frame indices of a video are detected, the others are interpolated.
+
+    The cost of a detected frame is the largest of the moving average latencies reported with update() by the
+    stages that work on detected frames only: the stages run on their own threads, so the slowest one limits
+    throughput. The stride grows as soon as that cost exceeds `headroom` of the frame interval and shrinks again
+    once it is comfortably below, up to max_stride. Disabled, every frame is detected (offline processing).
+    """
+
+    def __init__(self, fps: float, max_stride: int = 8, enabled: bool = True, headroom: float = 0.9):
+        self.fps = fps
+        self.max_stride = max(max_stride, 1)
+        self.enabled = enabled
+        self.headroom = headroom  # fraction of the frame interval detection may use
+        self.stride = 1  # detect one frame out of stride
+        self.latency = {}  # stage name -> moving average seconds per detected frame
+        self.next = 0  # index of the next frame to detect
+        self.detected = self.skipped = 0
+        self.lock = Lock()
+
+    @property
+    def cost(self) -> float:
+        """Seconds per detected frame of the slowest stage."""
+        return max(self.latency.values(), default=0.0)
+
+    @property
+    def effective_fps(self) -> float:
+        return self.fps / self.stride
+
+    def detect(self, i: int) -> bool:
+        """True if frame i must go through the detector, frames must be asked in increasing order."""
+        with self.lock:
+            if not self.enabled or i >= self.next:
+                self.next = i + self.stride
+                self.detected += 1
+                return True
+            self.skipped += 1
+            return False
+
+    def update(self, stage: str, seconds: float, n: int = 1):
+        """Report that a stage spent seconds on n detected frames."""
+        if n <= 0:
+            return
+        s = seconds / n
+        with self.lock:
+            self.latency[stage] = s if stage not in self.latency else 0.8 * self.latency[stage] + 0.2 * s  # EMA
+            if self.enabled:
+                self._adapt()
+
+    def _adapt(self):
+        need = self.cost * self.fps / self.headroom  # frame intervals spent per detected frame
+        if need > self.stride:
+            stride = math.ceil(need)
+        elif need < 0.8 * (self.stride - 1):  # hysteresis, avoids flapping around an integer stride
+            stride = max(math.ceil(need), 1)
+        else:
+            return
+        stride = min(stride, self.max_stride)
+        if stride != self.stride:
+            self.stride = stride
+            print(f'Scheduler: {1000 * self.cost:.0f}ms per detected frame, detecting every {stride} frame(s) '
+                  f'({self.effective_fps:.1f}/{self.fps:.0f} FPS)')
+
+    def __str__(self):
+        return f'detect: {self.effective_fps:.1f}/{self.fps:.0f} FPS'
+
+
+def match_analysis(a: List[dict], b: List[dict], match_iou: float = 0.3) -> List[Optional[int]]:
+    """Index in b of the same fruit as every analysis entry of a, or None.
+
+    Entries with a track ID are matched by ID, the others by box IoU (Hungarian) among entries of the same class.
+    """
+    matched = [None] * len(a)
+    ids = {x['track_id']: j for j, x in enumerate(b) if x.get('track_id') is not None}
+    for i, x in enumerate(a):
+        if x.get('track_id') is not None:
+            matched[i] = ids.get(x['track_id'])
+    ra = [i for i, x in enumerate(a) if x.get('track_id') is None]
+    rb = [j for j, x in enumerate(b) if x.get('track_id') is None]
+    if ra and rb:
+        iou = iou_matrix(np.array([a[i]['bbox'] for i in ra], dtype=float),
+                         np.array([b[j]['bbox'] for j in rb], dtype=float))
+        iou[np.array([a[i]['class'] for i in ra])[:, None] != np.array([b[j]['class'] for j in rb])[None]] = 0
+        for r, c in zip(*linear_sum_assignment(-iou)):
+            if iou[r, c] >= match_iou:
+                matched[ra[r]] = rb[c]
+    return matched
+
+
+def interpolate_result(prev: dict, nxt: Optional[dict], t: float) -> dict:
+    """Results of a skipped frame at fraction t (0-1) of the way between two processed frames.
+
+    Boxes of fruits found in both frames move linearly, analysis values are the ones of prev. Fruits only found
+    in one of the frames appear or disappear halfway. With nxt None (end of the video) prev is repeated.
+    """
+    analysis = []
+    if nxt is None:
+        analysis = list(prev['analysis'])
+    else:
+        matched = match_analysis(prev['analysis'], nxt['analysis'])
+        for x, j in zip(prev['analysis'], matched):
+            if j is not None:
+                b0, b1 = np.array(x['bbox'], dtype=float), np.array(nxt['analysis'][j]['bbox'], dtype=float)
+                analysis.append({**x, 'bbox': [int(v) for v in np.round(b0 + t * (b1 - b0))]})
+            elif t < 0.5:
+                analysis.append(x)
+        if t >= 0.5:
+            found = set(j for j in matched if j is not None)
+            analysis += [x for j, x in enumerate(nxt['analysis']) if j not in found]
+
+    det = torch.tensor([[*x['bbox'], x['confidence'], x['class']] for x in reversed(analysis)]).reshape(-1, 6)
+    return {**prev,
+            'detections': [det],
+            'detections_info': [{k: x[k] for k in ('name', 'confidence', 'bbox', 'quality')} for x in analysis],
+            'qualities': [x['quality'] for x in analysis],
+            'nutritional_info': {**prev['nutritional_info'], **(nxt['nutritional_info'] if nxt else {})},
+            'analysis': analysis,
+            'interpolated': True}
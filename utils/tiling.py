@@ -0,0 +1,106 @@
+"""
+Tiled (sliced) inference for high resolution images.
+
+The image is cut into overlapping tiles that are each run at the model input size, so small fruit keep their
+native resolution. Tile detections are mapped back to image coordinates and merged across the tile seams.
+"""
+
+from typing import Callable, List, Tuple
+
+import numpy as np
+import torch
+
+
+def tile_windows(height: int, width: int, tile: int, overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """(x1, y1, x2, y2) windows of at most tile x tile pixels covering the image, the last row/column of tiles is
+    aligned with the image border."""
+    step = max(int(tile * (1 - overlap)), 1)
+
+    def starts(n):
+        if n <= tile:
+            return [0]
+        s = list(range(0, n - tile, step))
+        return s + [n - tile]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height)) for y in starts(height) for x in starts(width)]
+
+
+def tile_cut(det: torch.Tensor, window: Tuple[int, int, int, int], width: int, height: int,
+             margin: float = 2) -> torch.Tensor:
+    """(n,) True for the detections of a tile (in tile coordinates) that touch a tile border inside the image, i.e.
+    fruit cut by the tile seam."""
+    x1, y1, x2, y2 = window
+    b = det[:, :4]
+    return ((b[:, 0] <= margin) & (x1 > 0)) | ((b[:, 1] <= margin) & (y1 > 0)) | \
+        ((b[:, 2] >= x2 - x1 - margin) & (x2 < width)) | ((b[:, 3] >= y2 - y1 - margin) & (y2 < height))
+
+
+def merge_detections(det: torch.Tensor, source: torch.Tensor, cut: torch.Tensor = None, match_thres: float = 0.5,
+                     agnostic: bool = False, max_det: int = 300, full: int = -1):
+    """Greedy merge of (n, 6) detections of overlapping tiles, source holds the window index of every detection.
+
+    Boxes of different tiles are compared by intersection over the smaller box rather than IoU, so a fruit cut by a
+    tile seam is suppressed by the complete box of the same fruit from the neighbouring tile. Boxes of the same tile
+    already went through NMS and never suppress each other, so clustered fruit of one tile are kept. Detections of
+    source `full` (the downscaled whole image pass) never suppress complete tile boxes: they are dropped when a tile
+    box that is not cut (see tile_cut()) covers the same fruit, otherwise they replace the cut fragments of a fruit
+    larger than a tile.
+    """
+    if len(det) < 2:
+        return det
+    order = det[:, 4].argsort(descending=True)
+    det, source = det[order], source[order]
+    cut = cut[order] if cut is not None else torch.zeros(len(det), dtype=torch.bool, device=det.device)
+    boxes = det[:, :4]
+    area = (boxes[:, 2] - boxes[:, 0]).clamp(0) * (boxes[:, 3] - boxes[:, 1]).clamp(0)
+    tl = torch.max(boxes[:, None, :2], boxes[None, :, :2])
+    br = torch.min(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = (br - tl).clamp(0).prod(2)
+    ios = inter / torch.min(area[:, None], area[None]).clamp(min=1e-9)  # intersection over smaller
+    overlap = (ios > match_thres) & (source[:, None] != source[None])  # different windows only
+    if not agnostic:
+        overlap &= det[:, None, 5] == det[None, :, 5]  # same class only
+
+    is_full = source == full
+    keep = torch.ones(len(det), dtype=torch.bool, device=det.device)
+    for i in range(len(det)):  # tile boxes
+        if keep[i] and not is_full[i]:
+            keep[i + 1:] &= ~(overlap[i, i + 1:] & ~is_full[i + 1:])
+    for i in torch.nonzero(is_full).flatten().tolist():  # whole image boxes, highest confidence first
+        hits = overlap[i] & keep & ~is_full
+        if (hits & ~cut).any():
+            keep[i] = False  # a tile found the complete fruit
+        else:
+            keep &= ~(hits & cut)
+    return det[keep][:max_det]
+
+
+def tiled_predict(predict: Callable[[List[np.ndarray]], List[torch.Tensor]], image: np.ndarray, tile: int = 640,
+                  overlap: float = 0.2, batch_size: int = 8, full: bool = True, match_thres: float = 0.5,
+                  agnostic: bool = False) -> torch.Tensor:
+    """Run predict() over the tiles of an image and return the merged (n, 6) detections in image coordinates.
+
+    predict takes a list of BGR crops and returns one detection tensor per crop in crop coordinates, it is called
+    with up to batch_size crops at a time. With full, the whole downscaled image is added as one more crop so large
+    fruit spanning several tiles are still found.
+    """
+    h, w = image.shape[:2]
+    windows = tile_windows(h, w, tile, overlap)
+    if full and len(windows) > 1:
+        windows.append((0, 0, w, h))
+    dets, sources, cuts = [], [], []
+    for i in range(0, len(windows), batch_size):
+        chunk = windows[i:i + batch_size]
+        crops = predict([image[y1:y2, x1:x2] for x1, y1, x2, y2 in chunk])
+        for j, ((x1, y1, x2, y2), det) in enumerate(zip(chunk, crops), i):
+            if len(det):
+                cuts.append(tile_cut(det, (x1, y1, x2, y2), w, h))
+                det = det.clone()
+                det[:, [0, 2]] += x1
+                det[:, [1, 3]] += y1
+                dets.append(det)
+                sources.append(torch.full((len(det),), j, device=det.device))
+    if not dets:
+        return torch.zeros((0, 6))
+    full = len(windows) - 1 if full and len(windows) > 1 else -1  # index of the whole image window
+    return merge_detections(torch.cat(dets, 0), torch.cat(sources), torch.cat(cuts), match_thres, agnostic, full=full)
@@ -93,6 +93,58 @@ def time_synchronized():
     return time.time()
 
 
+def smart_inference_mode():
+    # torch.inference_mode() on torch>=1.9, torch.no_grad() on older versions. Use as decorator or context manager
+    return torch.inference_mode() if hasattr(torch, 'inference_mode') else torch.no_grad()
+
+
+def prepare_model(model, channels_last=False):
+    # Prepare a loaded model for inference: fused Conv2d() + BatchNorm2d(), eval mode, no gradients and optionally
+    # channels_last memory format. Safe to call on already fused models
+    for m in model.modules():
+        if hasattr(m, 'fuseforward') and isinstance(getattr(m, 'bn', None), nn.BatchNorm2d):
+            m.conv = fuse_conv_and_bn(m.conv, m.bn)  # update conv
+            delattr(m, 'bn')  # remove batchnorm
+            m.forward = m.fuseforward  # update forward
+    model.eval()
+    for p in model.parameters():
+        p.detach_()  # no gradients, also drops the BatchNorm2d() graph fuse_conv_and_bn() leaves on fused weights
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+    return model
+
+
+class InputBuffer:
+    # Model input tensor reused across frames. Copies BCHW numpy images (0 - 255) through a pinned host buffer (CUDA)
+    # into a pre-allocated device tensor scaled to 0.0 - 1.0. Buffers are only re-allocated when the input shape, type
+    # or device changes, the returned tensor is overwritten by the next call
+    def __init__(self, channels_last=False):
+        self.channels_last = channels_last
+        self.host = None  # pinned staging buffer (CUDA only)
+        self.x = None  # model input
+        self.copied = None  # CUDA event of the last host to device copy
+
+    def __call__(self, img, device=torch.device('cpu'), dtype=torch.float32):
+        img = torch.from_numpy(img)
+        if self.x is None or self.x.shape != img.shape or self.x.device != device or self.x.dtype != dtype or \
+                (self.host is not None and self.host.dtype != img.dtype):
+            cuda = device.type != 'cpu'
+            self.host = torch.empty(img.shape, dtype=img.dtype, pin_memory=True) if cuda else None
+            self.copied = None
+            self.x = torch.empty(img.shape, dtype=dtype, device=device,
+                                 memory_format=torch.channels_last if self.channels_last else torch.contiguous_format)
+        if self.host is not None:
+            if self.copied is not None:
+                self.copied.synchronize()  # previous upload finished reading the staging buffer
+            self.host.copy_(img)
+            self.x.copy_(self.host, non_blocking=True)  # uint8 to fp16/32
+            self.copied = torch.cuda.Event()
+            self.copied.record()
+        else:
+            self.x.copy_(img)  # uint8 to fp16/32
+        return self.x.div_(255.0)  # 0 - 255 to 0.0 - 1.0
+
+
 def profile(x, ops, n=100, device=None):
     # profile a pytorch module or list of modules. Example usage:
     #     x = torch.randn(16, 3, 640, 640)  # input
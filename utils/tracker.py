@@ -0,0 +1,141 @@
+"""
+SORT-style multi-object tracker for fruit detections.
+
+Each track follows one fruit across video frames with a constant velocity Kalman filter on its box, NMS output
+boxes are matched to the predicted track boxes by IoU with the Hungarian algorithm. Tracks keep the FruitQuality
+computed for their fruit so it is only analyzed again when its box changes noticeably.
+"""
+
+from collections import Counter
+from typing import List, Optional
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from utils.fruit_analysis import FruitQuality
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of every box of a (n, 4) with every box of b (m, 4), both xyxy."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)))
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), 2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], 1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], 1)
+    return inter / (area_a[:, None] + area_b[None] - inter + 1e-9)
+
+
+class KalmanBox:
+    """Constant velocity Kalman filter on a box state (cx, cy, w, h, vx, vy, vw, vh)."""
+
+    F = np.eye(8) + np.eye(8, k=4)  # transition
+    H = np.eye(4, 8)  # measurement
+    Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 0.0001, 0.0001])  # process noise, scaled by the box size
+    R = np.diag([1, 1, 10, 10])  # measurement noise, scaled by the box size
+
+    def __init__(self, box: np.ndarray):
+        self.x = np.r_[self.to_z(box), np.zeros(4)]
+        scale = max(self.x[2], self.x[3]) / 20
+        self.P = np.diag([1, 1, 1, 1, 100, 100, 100, 100]) * scale ** 2
+
+    @staticmethod
+    def to_z(box: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = box
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=float)
+
+    def box(self) -> np.ndarray:
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def predict(self) -> np.ndarray:
+        self.x = self.F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1)  # keep a valid box
+        scale = max(self.x[2], self.x[3]) / 20
+        self.P = self.F @ self.P @ self.F.T + self.Q * scale ** 2
+        return self.box()
+
+    def update(self, box: np.ndarray):
+        scale = max(self.x[2], self.x[3]) / 20
+        y = self.to_z(box) - self.H @ self.x  # innovation
+        S = self.H @ self.P @ self.H.T + self.R * scale ** 2
+        K = self.P @ self.H.T @ np.linalg.inv(S)  # Kalman gain
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+
+
+class Track:
+    """One fruit followed across frames."""
+
+    def __init__(self, track_id: int, box: np.ndarray, cls: int):
+        self.id = track_id
+        self.cls = int(cls)
+        self.kf = KalmanBox(box)
+        self.hits = 1  # frames with a matched detection
+        self.missed = 0  # consecutive frames without a matched detection
+        self.quality: Optional[FruitQuality] = None  # cached analysis of this fruit
+        self.analyzed_box: Optional[np.ndarray] = None  # box the cached analysis was computed on
+
+    def needs_analysis(self, box: np.ndarray, iou_thres: float) -> bool:
+        """True if the fruit was never analyzed or its box moved or resized too much since."""
+        return self.quality is None or iou_matrix(box[None], self.analyzed_box[None])[0, 0] < iou_thres
+
+    def set_quality(self, quality: FruitQuality, box: np.ndarray):
+        self.quality, self.analyzed_box = quality, box.copy()
+
+
+class Tracker:
+    """Assigns persistent track IDs to per-frame detections and counts unique fruits.
+
+    A track is counted once it has been matched in min_hits frames, and dropped after max_age frames without a
+    match. Detections are only matched to tracks of the same class.
+    """
+
+    def __init__(self, iou_thres: float = 0.3, max_age: int = 30, min_hits: int = 3):
+        self.iou_thres = iou_thres
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.tracks: List[Track] = []
+        self.counts = Counter()  # class index -> unique confirmed tracks
+        self.weights = {}  # track ID -> (class index, estimated weight) of confirmed tracks, filled by the detector
+        self.next_id = 1
+
+    def reset(self):
+        self.tracks, self.counts, self.weights, self.next_id = [], Counter(), {}, 1
+
+    def update(self, boxes: np.ndarray, classes: np.ndarray) -> List[Track]:
+        """Match one frame's detections (n, 4) xyxy boxes and (n,) classes, returns the Track of every detection."""
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        classes = np.asarray(classes, dtype=int).reshape(-1)
+        predicted = np.array([t.kf.predict() for t in self.tracks]).reshape(-1, 4)
+
+        iou = iou_matrix(boxes, predicted)
+        iou[classes[:, None] != np.array([t.cls for t in self.tracks], dtype=int)[None]] = 0  # same class only
+        rows, cols = linear_sum_assignment(-iou) if iou.size else (np.empty(0, int), np.empty(0, int))
+
+        matched = [None] * len(boxes)
+        for i, j in zip(rows, cols):
+            if iou[i, j] >= self.iou_thres:
+                matched[i] = self.tracks[j]
+
+        seen = set()
+        for i, track in enumerate(matched):
+            if track is None:  # new fruit
+                track = Track(self.next_id, boxes[i], classes[i])
+                self.next_id += 1
+                self.tracks.append(track)
+                matched[i] = track
+            else:
+                track.kf.update(boxes[i])
+                track.hits += 1
+            track.missed = 0
+            if track.hits == self.min_hits:
+                self.counts[track.cls] += 1
+            seen.add(track.id)
+
+        for track in self.tracks:
+            if track.id not in seen:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_age]
+        return matched